@@ -0,0 +1,55 @@
+"""
+Size of the data each chart inlines into its spec, compared with the full
+filtered slice the charts used to embed. The server-side boxplot statistics
+and rankings are checked against direct computations in tests/test_charts.py.
+
+Usage:
+    python benchmarks/bench_chart_data.py
+"""
+import inspect
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import app  # noqa: E402
+import dataset  # noqa: E402
+
+# the merged data, with every CSV column
+gap, _ = dataset.load_data(app.data_dir, app.snapshot_dir)
+
+CHARTS = [
+    ("plot_world_map", ("life_expectancy", None, 2010), (None, None)),
+    ("plot_box_plot", ("life_expectancy", None, None, None, 2010), (None, None)),
+    ("plot_bubble_chart", ("life_expectancy", "Asia", None, None, 2010), ("Asia", None)),
+    ("plot_bar_chart", ("life_expectancy", None, "Top", None, 2010), (None, None)),
+]
+
+
+def inlined_bytes(name, args):
+    app.chart_renderer = "vega"
+    spec = json.loads(inspect.unwrap(getattr(app, name))(*args))
+    return len(json.dumps(spec.get("datasets", {})))
+
+
+def slice_bytes(region, sub_region, yr):
+    """Size of the slice with every CSV column, as the charts used to embed it."""
+    rows = gap[gap["year"] == yr]
+    if sub_region:
+        rows = rows[rows["sub_region"] == sub_region]
+    elif region:
+        rows = rows[rows["region"] == region]
+    return len(rows.to_json(orient="records"))
+
+
+def main():
+    print(f"{'chart':<20}{'slice (B)':>12}{'inlined (B)':>13}{'ratio':>8}")
+    for name, args, (region, sub_region) in CHARTS:
+        before = slice_bytes(region, sub_region, args[-1])
+        after = inlined_bytes(name, args)
+        print(f"{name:<20}{before:>12}{after:>13}{before / after:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for filter_data: the original string-built DataFrame.query
+implementation against slicing the data cube.
+
+Usage:
+    python benchmarks/bench_filter_data.py [repeats]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import app  # noqa: E402
+import dataset  # noqa: E402
+
+# the merged data, as the original filter_data queried it
+gap, _ = dataset.load_data(app.data_dir, app.snapshot_dir)
+
+SELECTIONS = [
+    (None, None, None, 2010),
+    ("Asia", None, None, 1990),
+    ("Europe", "Northern Europe", None, 1970),
+    ("Africa", "Sub-Saharan Africa", None, 2005),
+    (None, None, "Canada", 2000),
+]
+
+
+def filter_data_query(region, sub_region, country, yr):
+    """The original filter_data, kept here as the baseline."""
+    if country:
+        data = gap.query(f"country == '{country}'")
+    elif sub_region:
+        data = gap.query(f"sub_region == '{sub_region}'")
+    elif region:
+        data = gap.query(f"region == '{region}'")
+    else:
+        data = gap
+    if yr:
+        data = data.query(f"year == {yr}")
+    return data
+
+
+def main(repeats=200):
+    for args in SELECTIONS:
+        before = filter_data_query(*args)
+        after = app.filter_data(*args)
+        assert sorted(before["country"]) == sorted(after["country"]), args
+
+    print(f"{'selection':<48}{'query (us)':>12}{'cube (us)':>12}{'speedup':>9}")
+    for args in SELECTIONS:
+        old = min(timeit.repeat(lambda: filter_data_query(*args), number=repeats, repeat=3))
+        new = min(timeit.repeat(lambda: app.filter_data(*args), number=repeats, repeat=3))
+        old, new = old / repeats * 1e6, new / repeats * 1e6
+        print(f"{str(args):<48}{old:>12.1f}{new:>12.1f}{old / new:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,44 @@
+"""
+Payload size of each chart callback response when charts are sent as
+standalone HTML pages (CHART_RENDERER=iframe) and as Vega-Lite specs
+embedded client-side (CHART_RENDERER=vega), raw and gzip-compressed.
+
+Usage:
+    python benchmarks/bench_payload_size.py
+"""
+import gzip
+import inspect
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import app  # noqa: E402
+
+CHARTS = [
+    ("plot_world_map", ("life_expectancy", None, 2010)),
+    ("plot_box_plot", ("life_expectancy", None, None, None, 2010)),
+    ("plot_bubble_chart", ("life_expectancy", None, None, None, 2010)),
+    ("plot_bar_chart", ("life_expectancy", None, "Top", None, 2010)),
+]
+
+
+def response_size(name, args, renderer):
+    """Size of the callback response body, as Dash JSON-encodes it."""
+    app.chart_renderer = renderer
+    chart = inspect.unwrap(getattr(app, name))(*args)
+    body = json.dumps({"response": {"props": {"srcDoc": chart}}}).encode()
+    return len(body), len(gzip.compress(body))
+
+
+def main():
+    print(f"{'chart':<20}{'iframe':>10}{'vega':>10}{'iframe gz':>12}{'vega gz':>10}")
+    for name, args in CHARTS:
+        html, html_gz = response_size(name, args, "iframe")
+        spec, spec_gz = response_size(name, args, "vega")
+        print(f"{name:<20}{html:>10}{spec:>10}{html_gz:>12}{spec_gz:>10}")
+
+
+if __name__ == "__main__":
+    main()
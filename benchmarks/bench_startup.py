@@ -0,0 +1,50 @@
+"""
+Startup benchmark: load the merged gapminder data from the raw CSV files
+and from the Feather snapshot, each in a fresh interpreter, and report the
+load time and the peak resident memory of the process.
+
+Usage:
+    python src/dataset.py                 # write the snapshot first
+    python benchmarks/bench_startup.py [repeats]
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {src!r})
+import dataset
+start = time.perf_counter()
+gap, _ = dataset.load_data({data!r}, {snapshot!r})
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": rss, "rows": len(gap)}}))
+"""
+
+
+def run(snapshot_dir):
+    code = CHILD.format(
+        src=os.path.join(ROOT, "src"),
+        data=os.path.join(ROOT, "data"),
+        snapshot=snapshot_dir,
+    )
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True)
+    return json.loads(out.stdout)
+
+
+def main(repeats=5):
+    snapshot_dir = os.environ.get("DATA_SNAPSHOT_DIR", os.path.join(ROOT, "build/data"))
+    print(f"{'source':<10}{'load (ms)':>12}{'max RSS (MB)':>14}")
+    for name, path in [("csv", None), ("snapshot", snapshot_dir)]:
+        runs = [run(path) for _ in range(repeats)]
+        seconds = min(r["seconds"] for r in runs)
+        rss = min(r["max_rss_kb"] for r in runs) / 1024
+        print(f"{name:<10}{seconds * 1000:>12.1f}{rss:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
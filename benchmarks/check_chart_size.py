@@ -0,0 +1,88 @@
+"""
+Check that the Vega-Lite spec of every chart stays within a size budget, for
+every metric and geography, so that a change to how the charts inline their
+data can't silently bloat the callback responses. Exits with status 1 when
+a chart exceeds its budget. tests/test_chart_size.py checks the budgets on
+the largest charts in pytest; this script sweeps every selection.
+
+Usage:
+    python benchmarks/check_chart_size.py [--years 1970,2010]
+"""
+import argparse
+import inspect
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import app  # noqa: E402
+import warmup  # noqa: E402
+
+# maximum size of each chart's spec, in bytes
+BUDGETS = {
+    "plot_world_map": 6_000,
+    "plot_box_plot": 4_500,
+    "plot_bubble_chart": 12_000,
+    "plot_bar_chart": 1_500,
+    "plot_world_map_years": 160_000,
+    "plot_bubble_chart_years": 320_000,
+    "plot_country_trends": 14_000,
+}
+
+
+def chart_size(name, args):
+    """Size of a chart as rendered, in bytes."""
+    return len(inspect.unwrap(getattr(app, name))(*args))
+
+
+def trend_countries(metric):
+    """As many countries as the drill-down compares, with the most years of data."""
+    cube = app.datasets.current.cube
+    years = pd.Series(
+        np.isfinite(cube.view(metric, None, None)).sum(axis=0),
+        index=cube.countries["country"].astype(str),
+    )
+    # ties broken by name
+    return tuple(sorted(years.sort_index().nlargest(app.TREND_MAX_COUNTRIES).index))
+
+
+def get_jobs(years):
+    jobs = [(name, args) for name, args in warmup.get_jobs() if args[-1] in years]
+    for metric in app.metrics:
+        for region, sub_region in warmup.get_geographies():
+            if sub_region is None:
+                jobs.append(("plot_world_map_years", (metric, region, years[-1])))
+            jobs.append(
+                ("plot_bubble_chart_years", (metric, region, sub_region, None, years[-1]))
+            )
+        jobs.append(("plot_country_trends", (metric, trend_countries(metric))))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", default="1970,2010", help="comma separated years")
+    args = parser.parse_args()
+
+    app.chart_renderer = "vega"
+    largest = defaultdict(lambda: (0, None))
+    for name, chart_args in get_jobs([int(yr) for yr in args.years.split(",")]):
+        size = chart_size(name, chart_args)
+        largest[name] = max(largest[name], (size, chart_args), key=lambda item: item[0])
+
+    failed = False
+    print(f"{'chart':<26}{'largest (B)':>12}{'budget (B)':>12}  largest for")
+    for name, budget in BUDGETS.items():
+        size, chart_args = largest[name]
+        failed |= size > budget
+        flag = "  OVER BUDGET" if size > budget else ""
+        print(f"{name:<26}{size:>12}{budget:>12}  {chart_args}{flag}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Load test replaying realistic control panel sessions against the dashboard.
+
+Each simulated user runs scripted interaction sessions (sliding the year
+from 1970 to 2010, cycling through the metrics, drilling into a continent
+and then a sub continent, switching tabs). Every control change sends the
+`_dash-update-component` requests the browser would send, one per server
+side callback listening to that control, built from the app's own
+`_dash-dependencies`. Per callback latency percentiles, throughput and
+response sizes (gzip-compressed, as sent) are reported.
+
+By default the Dash server runs in-process. With --workers (and optionally
+--threads), a local gunicorn is started for every combination instead, to
+see how throughput scales, and with --render-processes how rendering charts
+in a pool of processes per worker (RENDER_PROCESSES) changes tail latency.
+
+Usage:
+    python benchmarks/loadtest.py [--users 8] [--rounds 2] [--cold]
+    python benchmarks/loadtest.py --workers 1,2,4 --threads 1,4
+    python benchmarks/loadtest.py --cold --workers 2 --threads 1,4 --render-processes 0,2
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000
+"""
+import argparse
+import gzip
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+YEARS = list(range(1970, 2015, 5))
+METRICS = ["life_expectancy", "child_mortality", "pop_density"]
+INITIAL_STATE = {
+    "metric.value": "life_expectancy",
+    "region.value": None,
+    "sub_region.value": None,
+    "country.value": None,
+    "yr.value": 2010,
+    "radio.value": "Top",
+    "tabs.active_tab": "gdp",
+    "trend_countries.value": ["China", "India", "United States"],
+}
+
+
+def slide_year(state):
+    return [{"yr.value": yr} for yr in YEARS]
+
+
+def cycle_metrics(state):
+    return [{"metric.value": metric} for metric in METRICS[1:] + METRICS[:1]]
+
+
+def drill_down(state):
+    return [
+        {"region.value": "Europe"},
+        {"sub_region.value": "Northern Europe"},
+        {"country.value": "Sweden"},
+        {"radio.value": "Bottom"},
+        {"country.value": None},
+        {"sub_region.value": None},
+        {"region.value": None},
+        {"radio.value": "Top"},
+    ]
+
+
+def switch_tabs(state):
+    return [{"tabs.active_tab": "income"}, {"yr.value": 1990}, {"tabs.active_tab": "gdp"}]
+
+
+SESSIONS = [slide_year, cycle_metrics, drill_down, switch_tabs]
+
+
+class Client:
+    """Builds and sends the callback requests triggered by control changes."""
+
+    def __init__(self, url, dependencies):
+        self.url = url
+        # server side callbacks, keyed by the inputs that trigger them
+        self.callbacks = defaultdict(list)
+        for dep in dependencies:
+            if dep.get("clientside_function"):
+                continue
+            for inp in dep["inputs"]:
+                self.callbacks[f"{inp['id']}.{inp['property']}"].append(dep)
+
+    def changes(self, state, changed):
+        """Apply a change to the session state and send the triggered requests."""
+        state.update(changed)
+        results = []
+        sent = set()
+        for prop in changed:
+            for dep in self.callbacks[prop]:
+                if dep["output"] in sent:
+                    continue
+                sent.add(dep["output"])
+                results.append(self.send(state, dep, list(changed)))
+        return results
+
+    def send(self, state, dep, changed):
+        # multi-output callbacks are listed as "..id.prop...id.prop.."
+        outputs = [
+            dict(zip(("id", "property"), output.rsplit(".", 1)))
+            for output in dep["output"].strip(".").split("...")
+        ]
+        body = {
+            "output": dep["output"],
+            "outputs": outputs if dep["output"].startswith("..") else outputs[0],
+            "inputs": [
+                {**inp, "value": state.get(f"{inp['id']}.{inp['property']}")}
+                for inp in dep["inputs"]
+            ],
+            "changedPropIds": changed,
+            "state": [
+                {**st, "value": state.get(f"{st['id']}.{st['property']}")}
+                for st in dep.get("state", [])
+            ],
+        }
+        request = urllib.request.Request(
+            self.url + "/_dash-update-component",
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                content = response.read()
+                size = len(content)
+                if response.headers.get("Content-Encoding") == "gzip":
+                    content = gzip.decompress(content)
+        except urllib.error.HTTPError as error:
+            # e.g. 503 from a full render pool
+            return f"HTTP {error.code}", time.perf_counter() - start, 0
+        elapsed = time.perf_counter() - start
+        # report batched callbacks by the outputs they actually updated
+        updated = json.loads(content)["response"] if content else {}
+        # keep the outputs, e.g. stores read back as callback state
+        for output_id, props in updated.items():
+            for prop, value in props.items():
+                state[f"{output_id}.{prop}"] = value
+        return "+".join(updated) or "(none)", elapsed, size
+
+
+def run_user(client, rounds):
+    state = dict(INITIAL_STATE, **{"session.data": uuid.uuid4().hex})
+    results = []
+    for _ in range(rounds):
+        for session in SESSIONS:
+            for changed in session(state):
+                results += client.changes(state, changed)
+    return results
+
+
+def run_load(url, users, rounds):
+    with urllib.request.urlopen(url + "/_dash-dependencies", timeout=60) as response:
+        client = Client(url, json.load(response))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = list(
+            itertools.chain.from_iterable(pool.map(run_user, [client] * users, [rounds] * users))
+        )
+    return results, time.perf_counter() - start
+
+
+def report(results, elapsed, label):
+    by_callback = defaultdict(list)
+    for output, latency, size in results:
+        by_callback[output].append((latency, size))
+    print(f"\n{label}: {len(results)} requests in {elapsed:.1f}s, {len(results) / elapsed:.1f} req/s")
+    print(f"{'output':<40}{'count':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'mean size (B)':>15}")
+    for output, rows in sorted(by_callback.items()):
+        latency = np.array([r[0] for r in rows]) * 1000
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        size = np.mean([r[1] for r in rows])
+        print(f"{output:<40}{len(rows):>7}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{size:>15.0f}")
+    latency = np.array([r[1] for r in results]) * 1000
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+    size = np.mean([r[2] for r in results])
+    print(f"{'all':<40}{len(results):>7}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{size:>15.0f}")
+
+
+def wait_until_ready(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url + "/_dash-dependencies", timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} did not start")
+
+
+def start_in_process(port):
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    httpd = make_server("127.0.0.1", port, app.server, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def start_gunicorn(port, workers, threads, render_processes):
+    return subprocess.Popen(
+        [
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            f"--workers={workers}",
+            f"--threads={threads}",
+            "-b",
+            f"127.0.0.1:{port}",
+        ],
+        cwd=ROOT,
+        env=dict(os.environ, RENDER_PROCESSES=str(render_processes)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay control panel sessions.")
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--rounds", type=int, default=2, help="session rounds per user")
+    parser.add_argument("--cold", action="store_true", help="disable the chart cache and store")
+    parser.add_argument("--url", help="load test an already running server")
+    parser.add_argument("--workers", help="comma separated gunicorn worker counts")
+    parser.add_argument("--threads", default="1", help="comma separated gunicorn thread counts")
+    parser.add_argument(
+        "--render-processes",
+        default="0",
+        help="comma separated numbers of chart rendering processes per gunicorn worker",
+    )
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    if args.cold:
+        os.environ["CHART_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["CHART_STORE_DIR"] = os.path.join(ROOT, "build", "loadtest-empty")
+
+    if args.url:
+        results, elapsed = run_load(args.url, args.users, args.rounds)
+        report(results, elapsed, args.url)
+    elif args.workers:
+        url = f"http://127.0.0.1:{args.port}"
+        for workers, threads, render_processes in itertools.product(
+            map(int, args.workers.split(",")),
+            map(int, args.threads.split(",")),
+            map(int, args.render_processes.split(",")),
+        ):
+            proc = start_gunicorn(args.port, workers, threads, render_processes)
+            try:
+                wait_until_ready(url)
+                results, elapsed = run_load(url, args.users, args.rounds)
+            finally:
+                proc.terminate()
+                proc.wait()
+            report(
+                results,
+                elapsed,
+                f"gunicorn workers={workers} threads={threads} render_processes={render_processes}",
+            )
+    else:
+        url = f"http://127.0.0.1:{args.port}"
+        httpd = start_in_process(args.port)
+        try:
+            wait_until_ready(url)
+            results, elapsed = run_load(url, args.users, args.rounds)
+        finally:
+            httpd.shutdown()
+        report(results, elapsed, "in-process")
+
+
+if __name__ == "__main__":
+    main()
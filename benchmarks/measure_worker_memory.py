@@ -0,0 +1,90 @@
+"""
+Measure the memory of each gunicorn worker as the number of workers grows.
+
+For every worker count, start gunicorn with gunicorn.conf.py, request the
+dashboard a few times so the workers are warm, then read
+/proc/<pid>/smaps_rollup of every worker (Linux only) and report:
+
+- USS (unique set size): memory private to the worker, i.e. what adding one
+  more worker costs. With the preloaded, copy-on-write friendly layout it
+  should stay flat as workers are added.
+- PSS (proportional set size): private memory plus each worker's share of
+  the pages it shares with the master and the other workers.
+
+Usage:
+    python benchmarks/measure_worker_memory.py [N ...]     # default: 1 2 4 8
+    PRELOAD_APP=0 python benchmarks/measure_worker_memory.py
+"""
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BIND = "127.0.0.1:8787"
+
+
+def read_smaps_rollup(pid):
+    """Return the smaps_rollup fields of a process, in kB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+
+def get_worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def wait_until_ready(workers, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://{BIND}/", timeout=5)
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"gunicorn with {workers} workers did not start")
+
+
+def warm_up(requests):
+    for _ in range(requests):
+        urllib.request.urlopen(f"http://{BIND}/", timeout=30).read()
+
+
+def measure(workers):
+    proc = subprocess.Popen(
+        ["gunicorn", "-c", "gunicorn.conf.py", f"--workers={workers}", "-b", BIND],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(workers)
+        warm_up(workers * 4)
+        time.sleep(1)
+        stats = [read_smaps_rollup(pid) for pid in get_worker_pids(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait()
+    uss = [s["Private_Clean"] + s["Private_Dirty"] for s in stats]
+    pss = [s["Pss"] for s in stats]
+    return sum(uss) / len(uss) / 1024, sum(pss) / len(pss) / 1024
+
+
+def main(counts):
+    preload = os.environ.get("PRELOAD_APP", "1")
+    print(f"PRELOAD_APP={preload}")
+    print(f"{'workers':>8}{'USS/worker (MB)':>18}{'PSS/worker (MB)':>18}")
+    for workers in counts:
+        uss, pss = measure(workers)
+        print(f"{workers:>8}{uss:>18.1f}{pss:>18.1f}")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1, 2, 4, 8])
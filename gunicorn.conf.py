@@ -0,0 +1,40 @@
+"""
+Gunicorn settings for the dashboard, e.g.
+
+    gunicorn -c gunicorn.conf.py --workers=5
+
+By default the app (and with it the gapminder data, Altair and
+vega_datasets) is loaded once in the master process and shared with the
+forked workers copy-on-write. Set PRELOAD_APP=0 to load it in each worker
+instead.
+
+With RENDER_PROCESSES set, every worker renders the charts missing from its
+cache in a pool of that many processes of its own, so that it can be given
+several threads (e.g. --threads=4) that keep serving requests while charts
+render.
+
+With DATA_RELOAD_INTERVAL set, every worker watches the data files and
+loads a new version of the data in the background when they change.
+"""
+import gc
+import os
+
+wsgi_app = "app:server"
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+preload_app = os.environ.get("PRELOAD_APP", "1").lower() not in ("0", "false", "no")
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of reach of the garbage collector,
+    # so that collections in the workers don't write to (and so copy) the
+    # pages shared with the master.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Fork the chart rendering processes before the worker starts any
+    # request thread, or the thread watching the data files.
+    import app
+
+    app.render_pool.start()
+    app.datasets.watch(app.DATA_RELOAD_INTERVAL)
@@ -1,30 +1,426 @@
-from dash import Dash, html, dcc, Input, Output
+from dash import Dash, html, dcc, Input, Output, State, ClientsideFunction
+from dash import callback_context, no_update
+from dash.exceptions import PreventUpdate
 import numpy as np
 import pandas as pd
 import altair as alt
-from vega_datasets import data
 import dash_bootstrap_components as dbc
+import flask
+import glob
+import importlib.util
+import json
 import os
+import time
+from collections import namedtuple
 
+from chart_cache import ChartCache, ChartStore, normalize_arg
+from chart_data import compact_data
+from cube import DataCube
+from data_manager import DataManager
+from dataset import get_data_version, get_version_files, load_data
+from derived import selectable_metrics
+from downsample import lttb
+from export import MIMETYPES as EXPORT_MIMETYPES
+from export import byte_range, export_etag, iter_arrow, iter_chunks, iter_csv
+from geometry import (
+    GeometryAssets,
+    build_region_geometry,
+    decode_topology,
+    read_topology,
+)
+from http_cache import init_http_cache
+from instrumentation import instrument, registry, timed_stage
+from render_pool import RenderPool, RenderPoolBusy, RenderTimeout
+from supersede import RequestTracker
+
+
+# "iframe" sends every chart as a standalone HTML page for an Iframe srcDoc,
+# "vega" sends only the Vega-Lite spec, embedded by assets/vega_charts.js
+chart_renderer = os.environ.get("CHART_RENDERER", "iframe")
+VEGA_SCRIPTS = [
+    f"https://cdn.jsdelivr.net/npm/vega@{alt.VEGA_VERSION}",
+    f"https://cdn.jsdelivr.net/npm/vega-lite@{alt.VEGALITE_VERSION}",
+    f"https://cdn.jsdelivr.net/npm/vega-embed@{alt.VEGAEMBED_VERSION}",
+]
+
+# charts inline their data, however many rows the selection has
+alt.data_transformers.disable_max_rows()
 
 app = Dash(
-    __name__, title="Mindthegap Dashboard", external_stylesheets=[dbc.themes.BOOTSTRAP]
+    __name__,
+    title="Mindthegap Dashboard",
+    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    external_scripts=VEGA_SCRIPTS if chart_renderer == "vega" else [],
 )
 server = app.server
 
-# read in gapminder and continent data
+# time every callback; SLOW_CALLBACK_MS logs slower calls with their inputs
+slow_callback_ms = os.environ.get("SLOW_CALLBACK_MS")
+instrument(app, slow_threshold=float(slow_callback_ms) / 1000 if slow_callback_ms else None)
+
 current_dir = os.path.abspath(os.path.dirname(__file__))
-country_ids = pd.read_csv(os.path.join(current_dir, "../data/country_ids.csv"))
-gap = pd.read_csv(os.path.join(current_dir, "../data/gapminder.csv"))
-gap = gap.merge(country_ids, how="outer", on=["country"])
-gap["log_income"] = gap["income"].apply(np.log)
-
-# dictionary to generate dynamic metrics in altair
-metrics = {
-    "life_expectancy": "Life Expectancy",
-    "child_mortality": "Child Mortality",
-    "pop_density": "Population Density",
-}
+data_dir = os.path.join(current_dir, "../data")
+snapshot_dir = os.environ.get("DATA_SNAPSHOT_DIR", os.path.join(current_dir, "../build/data"))
+
+# dictionary to generate dynamic metrics in altair, from the metric registry
+metrics = selectable_metrics()
+
+# numeric columns encoded by at least one of the charts, held in the cube
+CUBE_COLUMNS = ["population", "income", "log_income", *metrics]
+
+# years selectable on the slider, which the animated charts scrub through in the browser
+ANIMATION_YEARS = (1970, 2010)
+
+# countries in the bar chart
+RANK_COUNT = 10
+
+# points of each country trajectory in the drill-down, out of one per year
+# since 1800, and countries it compares at most
+TREND_POINTS = int(os.environ.get("TREND_POINTS", 80))
+TREND_MAX_COUNTRIES = 8
+
+
+def build_ranking_index(cube, columns, n=RANK_COUNT):
+    """
+    Rank the countries of the world, of every region and of every sub
+    region by each metric, for every year, keeping the n lowest and n
+    highest, ties broken by country name.
+    Parameters
+    --------
+    cube: DataCube
+        The data cube
+    columns: list
+        Metrics to rank by
+    n: int
+        Number of countries kept at either end
+    Returns
+    --------
+    ids, ranks
+        A dict mapping (level, value) -> geography number, and a dict
+        mapping each metric to an array of (geography number, bottom/top,
+        year, rank) -> country ordinal, -1 past the number of countries
+        with a value
+    Example
+    --------
+    > ids, ranks = build_ranking_index(cube, ["life_expectancy"])
+    > ranks["life_expectancy"][ids[("region", "Asia")], 1, cube.year_index(2010)]
+    """
+    keys = [key for key in cube.ranges if key[0] != "country"]
+    ids = {key: i for i, key in enumerate(keys)}
+    names = cube.countries["country"].cat.codes.to_numpy()
+    ranks = {}
+    for col in columns:
+        ranked = np.full((len(keys), 2, len(cube.years), n), -1, dtype=np.int16)
+        for key, i in ids.items():
+            countries = cube.ranges[key]
+            # in name order, which the stable sorts keep for ties
+            by_name = countries.start + np.argsort(names[countries], kind="stable")
+            values = cube.values[cube.columns[col]][:, by_name]
+            for end, sort_key in enumerate((values, -values)):
+                # missing values sort last
+                order = np.argsort(sort_key, axis=1, kind="stable")[:, :n]
+                present = ~np.isnan(np.take_along_axis(values, order, axis=1))
+                ranked[i, end, :, : order.shape[1]] = np.where(present, by_name[order], -1)
+        ranks[col] = ranked
+    return ids, ranks
+
+
+# a version of the data, and everything the charts are looked up in
+Dataset = namedtuple("Dataset", ["version", "cube", "ranking_ids", "ranking_ranks"])
+
+
+def load_dataset():
+    """
+    Read in gapminder and continent data, from the snapshot when there is
+    one, and index it: every (metric, geography, year) selection is a view
+    into the data cube, and every bar chart a lookup in the ranking index.
+    """
+    gap, version = load_data(data_dir, snapshot_dir)
+    cube = DataCube(gap, CUBE_COLUMNS)
+    return Dataset(version, cube, *build_ranking_index(cube, list(metrics)))
+
+
+# version of the code drawing the charts, so that charts rendered by other
+# code, cached or pre-rendered, are never served
+code_version = get_data_version(sorted(glob.glob(os.path.join(current_dir, "*.py"))))
+
+
+def chart_version(data_version):
+    """
+    Version of the charts drawn from a version of the data: the key prefix
+    of the chart cache, the version of the chart store and of the ETags.
+    """
+    return f"{data_version}-{code_version}-{chart_renderer}"
+
+
+def swap_charts(old, new):
+    """Serve the charts pre-rendered for the new dataset, and forget the old ones."""
+    chart_cache.store = ChartStore(chart_cache.store.root, chart_version(new.version))
+    chart_cache.invalidate(chart_version(old.version))
+    compressed_cache.invalidate(chart_version(old.version))
+
+
+# the dataset is reloaded when its files change, checked every
+# DATA_RELOAD_INTERVAL seconds; a request is answered from the version
+# current when it started
+datasets = DataManager(
+    load_dataset,
+    lambda: get_data_version(get_version_files(data_dir)),
+    on_swap=swap_charts,
+)
+DATA_RELOAD_INTERVAL = float(os.environ.get("DATA_RELOAD_INTERVAL", 0))
+
+# version of the data the app started with, which the control panel and the
+# map geometry are built from
+data_version = datasets.current.version
+
+# region -> sub region -> country hierarchy of the dropdowns, embedded in the
+# layout and resolved in the browser by assets/geography.js
+geography = datasets.current.cube.hierarchy()
+
+
+@server.before_request
+def pin_dataset():
+    flask.g.dataset_token = datasets.pin()
+
+
+@server.teardown_request
+def unpin_dataset(error):
+    token = flask.g.pop("dataset_token", None)
+    if token is not None:
+        datasets.unpin(token)
+
+
+
+# rendered charts are memoized on the chart version and their (normalized)
+# callback inputs, falling back to the charts pre-rendered by warmup.py
+chart_cache = ChartCache(
+    max_entries=int(os.environ.get("CHART_CACHE_MAX_ENTRIES", 1024)),
+    max_bytes=int(os.environ.get("CHART_CACHE_MAX_BYTES", 256 * 2**20)),
+    store=ChartStore(
+        os.path.join(
+            os.environ.get("CHART_STORE_DIR", os.path.join(current_dir, "../build/charts")),
+            chart_renderer,
+        ),
+        chart_version(data_version),
+    ),
+    version=lambda: chart_version(datasets.active().version),
+    current=lambda: chart_version(datasets.current.version),
+)
+
+# compressed callback responses are cached apart from the charts, so that
+# their larger bodies don't evict charts; callback ETags change with the
+# data and with the code drawing them
+compressed_cache = ChartCache(
+    max_entries=int(os.environ.get("COMPRESSED_CACHE_MAX_ENTRIES", 1024)),
+    max_bytes=int(os.environ.get("COMPRESSED_CACHE_MAX_BYTES", 64 * 2**20)),
+    version=lambda: chart_version(datasets.active().version),
+    current=lambda: chart_version(datasets.current.version),
+)
+init_http_cache(server, compressed_cache, lambda: chart_version(datasets.active().version))
+
+# country shapes for the world map, and for each continent the world clipped
+# to it, pre-projected to the map size, all served from fingerprinted URLs
+MAP_WIDTH, MAP_HEIGHT = 900, 350
+geometry = GeometryAssets()
+world_topology = read_topology(os.path.join(current_dir, "../data/world-110m.json"))
+world_url = app.get_relative_path("/geo/" + geometry.add("world-110m", world_topology))
+world_countries = decode_topology(json.loads(world_topology))
+region_urls = {}
+for reg, ids in datasets.current.cube.countries.groupby("region", observed=True)["id"]:
+    region_geometry = build_region_geometry(
+        world_countries,
+        ids.tolist(),
+        MAP_WIDTH,
+        MAP_HEIGHT,
+    )
+    region_urls[reg] = app.get_relative_path(
+        "/geo/"
+        + geometry.add(
+            reg.lower(), json.dumps(region_geometry, separators=(",", ":")).encode()
+        )
+    )
+
+
+@server.route("/geo/<filename>")
+def serve_geometry(filename):
+    content = geometry.get(filename)
+    if content is None:
+        flask.abort(404)
+    response = flask.Response(content, mimetype="application/json")
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.set_etag(filename)
+    return response
+
+
+# latest chart request of each browser session: a newer one supersedes the
+# older ones still in flight, in any worker forked after this point
+chart_requests = RequestTracker()
+
+# charts missing from the cache are rendered by a bounded pool of processes
+# of each worker, when RENDER_PROCESSES is set, instead of the request thread
+render_pool = RenderPool(
+    processes=int(os.environ.get("RENDER_PROCESSES", 0)),
+    max_pending=int(os.environ.get("RENDER_QUEUE", 0)) or None,
+    queue_timeout=float(os.environ.get("RENDER_QUEUE_TIMEOUT_MS", 1000)) / 1000,
+    timeout=float(os.environ.get("RENDER_TIMEOUT_MS", 20000)) / 1000,
+    context=datasets,
+)
+
+
+@server.errorhandler(RenderPoolBusy)
+def render_pool_busy(error):
+    return flask.Response(str(error), status=503, headers={"Retry-After": "1"})
+
+
+@server.errorhandler(RenderTimeout)
+def render_timeout(error):
+    return flask.Response(str(error), status=504)
+
+
+# chart requests for a year or metric change wait this long before drawing
+# anything, and are dropped if a newer request arrived in the meantime
+CALLBACK_DEBOUNCE = float(os.environ.get("CALLBACK_DEBOUNCE_MS", 0)) / 1000
+
+# chart and compressed response cache counters, next to the callback
+# timings on /metrics
+for name, cache, entries in [
+    ("chart_cache", chart_cache, "charts"),
+    ("compressed_cache", compressed_cache, "compressed responses"),
+]:
+    label = name.replace("_", " ")
+    for stat, kind, description in [
+        ("hits", "counter", f"{label.capitalize()} hits."),
+        ("misses", "counter", f"{label.capitalize()} misses."),
+        ("evictions", "counter", f"{entries.capitalize()} evicted from the {label}."),
+        ("entries", "gauge", f"{entries.capitalize()} in the {label}."),
+        ("bytes", "gauge", f"Total size of the {entries} in the {label}."),
+    ]:
+        registry.collect(
+            f"mindthegap_{name}_{stat}" + ("_total" if kind == "counter" else ""),
+            description,
+            kind,
+            lambda cache=cache, stat=stat: cache.stats()[stat],
+        )
+
+
+registry.collect(
+    "mindthegap_superseded_requests_total",
+    "Chart requests dropped for a newer request from the same session.",
+    "counter",
+    lambda: chart_requests.superseded,
+)
+
+registry.collect(
+    "mindthegap_data_reloads_total",
+    "New versions of the data loaded since the worker started.",
+    "counter",
+    lambda: datasets.reloads,
+)
+
+for stat, kind, description in [
+    ("pending", "gauge", "Charts being rendered or queued in the render pool."),
+    ("rejected", "counter", "Charts rejected by a full render pool."),
+    ("timeouts", "counter", "Charts that took too long to render in the render pool."),
+    ("restarts", "counter", "Render pools replaced after one of their processes died."),
+    (
+        "unrestored",
+        "counter",
+        "Charts rendered in the request thread, as no longer servable by the render pool.",
+    ),
+]:
+    registry.collect(
+        f"mindthegap_render_pool_{stat}" + ("_total" if kind == "counter" else ""),
+        description,
+        kind,
+        lambda stat=stat: getattr(render_pool, stat),
+    )
+
+
+@server.route("/metrics")
+def serve_metrics():
+    return flask.Response(registry.expose(), mimetype="text/plain; version=0.0.4")
+
+
+# lengths of the exports byte ranges were requested of, by ETag, kept apart
+# from the charts so that they don't count in the chart cache statistics
+export_lengths = ChartCache(max_entries=256)
+
+
+@server.route("/export")
+def serve_export():
+    """
+    Stream the rows of the selected geography and years, with the selected
+    metrics, as CSV or Arrow IPC, e.g.
+    /export?format=arrow&metric=life_expectancy&region=Asia&first=1800&last=2018.
+    The geography is the narrowest of country, sub_region and region, as in
+    filter_data, the years default to all of them and the metrics to every
+    metric of the control panel. A single byte range and conditional
+    requests are supported.
+    """
+    args = flask.request.args
+    fmt = args.get("format", "csv")
+    selected = args.getlist("metric") or list(metrics)
+    if fmt not in EXPORT_MIMETYPES or not set(selected) <= set(metrics):
+        flask.abort(400)
+    if fmt == "arrow" and importlib.util.find_spec("pyarrow") is None:
+        flask.abort(406)
+    # the stream is generated after the request, from the data it started with
+    dataset = datasets.active()
+    years = dataset.cube.years
+    try:
+        first = max(int(args.get("first", years[0])), years[0])
+        last = min(int(args.get("last", years[-1])), years[-1])
+    except ValueError:
+        flask.abort(400)
+    if first > last:
+        flask.abort(400)
+    level, value = selection_level(args.get("region"), args.get("sub_region"), args.get("country"))
+    etag = export_etag(dataset.version, fmt, level, value, first, last, selected)
+
+    def generate():
+        chunks = iter_chunks(dataset.cube, level, value, first, last, selected)
+        return iter_csv(chunks) if fmt == "csv" else iter_arrow(chunks)
+
+    request = flask.request
+    response = flask.Response(mimetype=EXPORT_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=gapminder-{value or 'world'}-{first}-{last}.{fmt}"
+    )
+    if request.if_none_match.contains_weak(etag):
+        response.status_code = 304
+        return response
+    byte_ranges = request.range
+    if_range = request.if_range
+    if (
+        byte_ranges is not None
+        and byte_ranges.units == "bytes"
+        and len(byte_ranges.ranges) == 1
+        and if_range.date is None
+        and if_range.etag in (None, etag)
+    ):
+        # the length of the stream, to resolve the range against, is
+        # computed by generating it once
+        length = export_lengths.get(etag)
+        if length is None:
+            length = str(sum(map(len, generate())))
+            export_lengths.set(etag, length)
+        length = int(length)
+        span = byte_ranges.range_for_length(length)
+        if span is None:
+            response.status_code = 416
+            response.headers["Content-Range"] = f"bytes */{length}"
+            return response
+        response.status_code = 206
+        response.content_range = byte_ranges.to_content_range_header(length)
+        response.content_length = span[1] - span[0]
+        response.response = byte_range(generate(), *span)
+        return response
+    response.response = generate()
+    return response
+
 
 ############################## CONTROL PANEL FILTERS ##############################
 FILTER_STYLE = {"background-color": "#f8f9fa", "width": "18rem", "height": "100%"}
@@ -60,10 +456,7 @@ filter_panel = dbc.Card(
                     html.H5("2.  Continent", className="text-left"),
                     dcc.Dropdown(
                         id="region",
-                        options=[
-                            {"label": reg, "value": reg}
-                            for reg in gap["region"].dropna().unique()
-                        ],
+                        options=[{"label": reg, "value": reg} for reg in geography["regions"]],
                         value=None,
                     ),
                 ]
@@ -79,7 +472,13 @@ filter_panel = dbc.Card(
             ),
             html.Br(),
             html.Br(),
-            
+            # country drop down
+            dbc.Row(
+                [
+                    html.H5("4.  Country", className="text-left"),
+                    dcc.Dropdown(id="country", value=None),
+                ]
+            ),
             html.Br(),
             html.Br(),
             
@@ -90,6 +489,11 @@ filter_panel = dbc.Card(
                     dcc.Markdown("""Dataset for visualization of this dashbaord can be downloaded from [here](https://github.com/UBC-MDS/mindthegap/blob/main/data/gapminder.csv)
             """
             ),
+                    html.A(
+                        "Download the selected metric and region since 1800 (CSV)",
+                        id="export_link",
+                        href=app.get_relative_path("/export"),
+                    ),
                 ]
             ),
             html.Br(),
@@ -105,30 +509,69 @@ filter_panel = dbc.Card(
 )
 
 ############################## PLOT OBJECTS #######################################
-boxplot = html.Iframe(
-    id="boxplot",
-    style={"border-width": "0", "width": "100%", "min-height": "400px"},
+def chart_container(id, style):
+    """
+    Create the component a chart is rendered into: an Iframe, or a Div that
+    the Vega-Lite spec kept in the accompanying Store is embedded into.
+    """
+    if chart_renderer == "vega":
+        return html.Div([html.Div(id=id, style=style), dcc.Store(id=f"{id}_spec")])
+    return html.Iframe(id=id, style=style)
+
+
+def chart_output(id):
+    """The callback output that receives the chart serialized by render_chart."""
+    if chart_renderer == "vega":
+        return Output(f"{id}_spec", "data")
+    return Output(id, "srcDoc")
+
+
+@timed_stage("serialize")
+def render_chart(chart):
+    """Serialize a chart for the configured chart renderer."""
+    if chart_renderer == "vega":
+        return chart.to_json(indent=None)
+    return chart.to_html()
+
+
+boxplot = chart_container(
+    "boxplot",
+    {"border-width": "0", "width": "100%", "min-height": "400px"},
 )
 
-bubblechart = html.Iframe(
-    id="bubblechart",
-    style={"border-width": "0", "width": "100%", "height": "400px"},
+bubblechart = chart_container(
+    "bubblechart",
+    {"border-width": "0", "width": "100%", "height": "400px"},
 )
 
-barchart = html.Iframe(
-    id="barchart",
-    style={
+barchart = chart_container(
+    "barchart",
+    {
         "border-width": "0",
         "width": "100%",
         "height": "400px",
     },
 )
 
-worldmap = html.Iframe(
-    id="worldmap", 
-    style={"border-width": "4px", "width": "100%", "min-height": "400px"}
+trends = chart_container(
+    "trends",
+    {"border-width": "0", "width": "100%", "height": "400px"},
+)
+
+worldmap = chart_container(
+    "worldmap",
+    {"border-width": "4px", "width": "100%", "min-height": "400px"},
 )
 
+if chart_renderer == "vega":
+    for chart_id in ["boxplot", "bubblechart", "barchart", "worldmap", "trends"]:
+        app.clientside_callback(
+            ClientsideFunction(namespace="charts", function_name="render"),
+            Output(chart_id, "children"),
+            Input(f"{chart_id}_spec", "data"),
+            State(chart_id, "id"),
+        )
+
 ############################## DASHBOARD LAYOUT ###################################
 app.layout = dbc.Container(
     [
@@ -152,11 +595,13 @@ app.layout = dbc.Container(
                                     [
                                         html.H5("Select Year", className="text-left"),
                                         dcc.Slider(
-                                            min=1970,
-                                            max=2010,
-                                            step=5,
+                                            min=ANIMATION_YEARS[0],
+                                            max=ANIMATION_YEARS[1],
+                                            step=1,
                                             value=2010,
                                             id="yr",
+                                            # only send the year once the handle is released
+                                            updatemode="mouseup",
                                             marks={
                                                 str(i): {
                                                     "label": str(i),
@@ -165,6 +610,12 @@ app.layout = dbc.Container(
                                                 for i in range(1970, 2015, 5)
                                             },
                                         ),
+                                        # draw every year once and scrub them in the browser
+                                        dbc.Switch(
+                                            id="animate",
+                                            label="Scrub through every year on the map and bubble chart",
+                                            value=False,
+                                        ),
                                     ],
                                     md=10, lg=10
                                 ),
@@ -297,12 +748,49 @@ app.layout = dbc.Container(
                                                                 ],
                                                             ),
                                                         ),
-                                                        html.Div(id="tab-content")
+                                                        html.Div(
+                                                            id="tab-content",
+                                                            children=[
+                                                                html.Div(bubblechart, id="gdp-content"),
+                                                                html.Div(
+                                                                    boxplot,
+                                                                    id="income-content",
+                                                                    style={"display": "none"},
+                                                                ),
+                                                            ],
+                                                        )
                                                         ])
                                                         ],
                                                 md=6, lg=6),
                                             ]
                                         ),
+                                        dbc.Row([
+            html.H5("Country trends by Metric", style={"width": "fit-content"}),
+            dbc.Col(
+                        [
+                            dbc.Button(
+                                id="trends_tooltip",
+                                color="secondary",
+                                children=html.Strong("?"),
+                                size="sm",
+                                outline=True,
+                            ),
+                            dbc.Tooltip(
+                                f"Choose metric from the control panel and up to {TREND_MAX_COUNTRIES} countries to compare their metric over every year since 1800. Select a continent and/or sub continent to narrow down the countries offered",
+                                target="trends_tooltip",
+                                placement="bottom",
+                            ),
+                        ]                    )
+        ], style={"padding": "3vh 0"}),
+                                        dbc.Card([
+                                            dcc.Dropdown(
+                                                id="trend_countries",
+                                                multi=True,
+                                                value=["China", "India", "United States"],
+                                                placeholder="Select countries",
+                                            ),
+                                            html.Div(trends),
+                                        ]),
                                     ],
                                     md=10, lg=10
                                 ),
@@ -312,19 +800,71 @@ app.layout = dbc.Container(
                 ),
             ]
         ),
+        # the inputs each chart was last drawn with, see update_charts
+        dcc.Store(id="drawn", data={}),
+        # the geography of the dropdowns, see assets/geography.js
+        dcc.Store(id="geography", data=geography),
+        # random id of this page view, to supersede its outdated chart requests
+        dcc.Store(id="session"),
     ],
     fluid=True,
 )
 
+# the export of the data behind the charts follows the metric, geography and
+# country selected
+app.clientside_callback(
+    """
+    function(metric, region, sub_region, country, href) {
+        const params = new URLSearchParams({metric: metric});
+        if (region) { params.set("region", region); }
+        if (sub_region) { params.set("sub_region", sub_region); }
+        if (country) { params.set("country", country); }
+        return href.split("?")[0] + "?" + params.toString();
+    }
+    """,
+    Output("export_link", "href"),
+    Input("metric", "value"),
+    Input("region", "value"),
+    Input("sub_region", "value"),
+    Input("country", "value"),
+    State("export_link", "href"),
+)
+
+app.clientside_callback(
+    "function(id) { return Math.random().toString(36).slice(2) + Date.now().toString(36); }",
+    Output("session", "data"),
+    Input("session", "id"),
+)
+
 ############################## HELPER FUNCTIONS ###################################
-@app.callback(Output("tab-content", "children"), Input("tabs", "active_tab"))
+@app.callback(
+    Output("gdp-content", "style"),
+    Output("income-content", "style"),
+    Input("tabs", "active_tab"),
+)
 def render_graph(tabs):
-    if tabs == "gdp":
-        return html.Div([bubblechart])
-    elif tabs == "income":
-        return html.Div([boxplot])
+    """
+    Show the chart of the active tab. Both charts stay in the layout, so
+    that the batched chart callback can always target them.
+    """
+    hidden = {"display": "none"}
+    if tabs == "income":
+        return hidden, None
+    return None, hidden
 
 
+def selection_level(region, sub_region, country=None):
+    """The narrowest geography selected, as a (level, value) pair of the slice index."""
+    if country:
+        return "country", country
+    if sub_region:
+        return "sub_region", sub_region
+    if region:
+        return "region", region
+    return None, None
+
+
+@timed_stage("filter")
 def filter_data(region, sub_region, country, yr):
     """
     Filter data based on region, sub region and country selection
@@ -347,81 +887,209 @@ def filter_data(region, sub_region, country, yr):
     > filter_data("Asia", "Western Asia", "Yemen", 2015)
     """
     # Filter by region, sub-region, country
-    if country:
-        data = gap.query(f"country == '{country}'")
-    elif sub_region:
-        data = gap.query(f"sub_region == '{sub_region}'")
-    elif region:
-        data = gap.query(f"region == '{region}'")
+    level, value = selection_level(region, sub_region, country)
+    # Filter by year by slicing the year axis of the cube
+    yr = yr or None
+    return datasets.active().cube.select(level, value, yr, yr)
+
+
+@timed_stage("filter")
+def filter_years(region, sub_region, country, first, last):
+    """
+    Filter data based on region, sub region and country selection, for a
+    range of years.
+    Parameters
+    --------
+    region: string
+        Selection from the Region filter
+    sub_region: string
+        Selection from Sub Region filter
+    country: string
+        Selection from Country filter
+    first, last: int
+        First and last year of the range
+    Returns
+    --------
+    data
+        dataset that has been filtered on region, sub region and country
+        selection, for every year of the range
+    Example
+    --------
+    > filter_years("Asia", None, None, 1970, 2010)
+    """
+    level, value = selection_level(region, sub_region, country)
+    return datasets.active().cube.select(level, value, first, last)
+
+
+def year_selection(yr):
+    """A year selection driven by a slider in the chart, starting at yr."""
+    first, last = ANIMATION_YEARS
+    return alt.selection_single(
+        name="year",
+        fields=["year"],
+        init={"year": int(yr or last)},
+        bind=alt.binding_range(min=first, max=last, step=1, name="Year "),
+    )
+
+
+def value_domain(series):
+    """
+    Scale domain fixed across years, so that marks stay comparable; left to
+    Vega-Lite when there is no value at all, as a NaN domain isn't JSON.
+    """
+    low, high = float(series.min()), float(series.max())
+    if np.isnan(low) or np.isnan(high):
+        return alt.Undefined
+    return [low, high]
+
+
+def boxplot_stats(data, metric, by="income_group"):
+    """
+    Compute the boxplot summary Vega-Lite would otherwise compute in the
+    browser: quartiles, whiskers at the furthest values within 1.5 IQR of
+    the box, and the outliers beyond them.
+    Parameters
+    --------
+    data: DataFrame
+        Filtered gapminder data
+    metric: string
+        Column to summarize
+    by: string
+        Column to group by
+    Returns
+    --------
+    stats, outliers
+        One row of summary statistics per group, and the outlying rows
+    Example
+    --------
+    > boxplot_stats(filter_data("Asia", None, None, 2015), "child_mortality")
+    """
+    data = data.loc[data[by].notnull() & data[metric].notnull(), ["country", by, metric]]
+    if data.empty:
+        columns = [by, "q1", "median", "q3", "lower", "upper"]
+        return pd.DataFrame(columns=columns), data
+    groups = data.groupby(by, observed=True)[metric]
+    stats = groups.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    iqr = stats["q3"] - stats["q1"]
+    fences = data[[by]].join(
+        pd.DataFrame({"low": stats["q1"] - 1.5 * iqr, "high": stats["q3"] + 1.5 * iqr}),
+        on=by,
+    )
+    inside = data[metric].between(fences["low"], fences["high"])
+    whiskers = data[inside].groupby(by, observed=True)[metric].agg(["min", "max"])
+    stats = stats.join(whiskers.rename(columns={"min": "lower", "max": "upper"}))
+    return stats.reset_index(), data[~inside]
+
+
+def rank_countries(metric, region, sub_region, yr, radio):
+    """
+    Look up the RANK_COUNT countries with the highest (or lowest) value of
+    a metric in the ranking index.
+    Parameters
+    --------
+    metric: string
+        Column to rank by
+    region: string
+        Selection from the region filter
+    sub_region: string
+        Selection from sub region filter
+    yr: integer
+        Year ranked
+    radio: string
+        "Top" for the highest values, otherwise the lowest
+    Returns
+    --------
+    data
+        The ranked countries and their metric, highest (or lowest) first
+    Example
+    --------
+    > rank_countries("child_mortality", "Asia", None, 2015, "Top")
+    """
+    dataset = datasets.active()
+    cube = dataset.cube
+    geography = dataset.ranking_ids.get(selection_level(region, sub_region))
+    year = cube.year_index(yr)
+    if geography is None or year is None:
+        countries, year = np.array([], dtype=int), 0
     else:
-        data = gap
-    # Filter by year
-    if yr:
-        data = data.query(f"year == {yr}")
+        countries = dataset.ranking_ranks[metric][geography, int(radio == "Top"), year]
+        countries = countries[countries >= 0]
+    data = cube.countries[["country"]].iloc[countries].reset_index(drop=True)
+    return data.assign(**{metric: cube.values[cube.columns[metric], year, countries]})
 
+
+def country_trends(metric, countries, points=TREND_POINTS):
+    """
+    Trajectories of a metric across all years for a few countries, each
+    downsampled to a number of points with LTTB.
+    Parameters
+    --------
+    metric: string
+        Column to plot
+    countries: list
+        Country names, unknown ones ignored
+    points: int
+        Maximum number of points of each trajectory
+    Returns
+    --------
+    data
+        One row per country and year kept, with its value of the metric
+    Example
+    --------
+    > country_trends("life_expectancy", ["China", "India"])
+    """
+    cube = datasets.active().cube
+    frames = []
+    for country in countries:
+        geography = ("country", country)
+        if geography not in cube.ranges:
+            continue
+        values = cube.view(metric, *geography)[:, 0]
+        present = np.flatnonzero(~np.isnan(values))
+        kept = present[lttb(cube.years[present], values[present], points)]
+        frames.append(
+            pd.DataFrame({"country": country, "year": cube.years[kept], metric: values[kept]})
+        )
+    if not frames:
+        return pd.DataFrame({"country": [], "year": [], metric: []})
+    data = pd.concat(frames, ignore_index=True)
+    data["country"] = data["country"].astype("category")
     return data
 
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="geography", function_name="sub_regions"),
     Output("sub_region", "options"),
     Input("region", "value"),
+    State("geography", "data"),
 )
-def get_sub_region(region):
-    """Get a sub region value(s) based on a region value in gapminder
-    Parameters
-    ----------
-    region : string
-        The region to get subregions for
-    Returns
-    -------
-    options
-        Dict of subregion label/values
-    """
-    if region is None:
-        options = [
-            {"label": sub_region, "value": sub_region}
-            for sub_region in gap["sub_region"].dropna().unique()
-        ]
-    else:
-        sub_regions = list(gap[gap["region"] == region]["sub_region"].unique())
-        options = []
-        for sr in sub_regions:
-            options.append({"label": sr, "value": sr})
-    return options
-
-    @app.callback(
-        Output("country", "options"),
-        Input("region", "value"),
-        Input("sub_region", "value"),
-    )
-    def get_country(region, sub_region):
-
-        """Get a sub region value(s) based on a region value in gapminder
-        Parameters
-        ----------
-        region : string
-            The region to get subregions for
-        Returns
-        -------
-        options
-            Dict of subregion label/values
-        """
-        options = [
-            {"label": cntry, "value": cntry}
-            for cntry in gap["country"].dropna().unique()
-        ]
-
-        return options
 
+# a country outside of the selected region and sub region is deselected
+app.clientside_callback(
+    ClientsideFunction(namespace="geography", function_name="countries"),
+    Output("country", "options"),
+    Output("country", "value"),
+    Input("region", "value"),
+    Input("sub_region", "value"),
+    State("country", "value"),
+    State("geography", "data"),
+)
 
-############################## PLOTTING FUNCTIONS #################################
-@app.callback(
-    Output("worldmap", "srcDoc"),
-    Input("metric", "value"),
+app.clientside_callback(
+    ClientsideFunction(namespace="geography", function_name="countries_with_selected"),
+    Output("trend_countries", "options"),
     Input("region", "value"),
-    Input("yr", "value"),
+    Input("sub_region", "value"),
+    State("trend_countries", "value"),
+    State("geography", "data"),
 )
-def plot_world_map(metric, region, yr):
+
+
+############################## PLOTTING FUNCTIONS #################################
+@chart_cache.memoize
+@render_pool.offload
+def plot_world_map(metric, region, yr, data=None):
     """
     Create world heatmap for statsitic of interest based on selected year filter.
     Parameters
@@ -430,6 +1098,8 @@ def plot_world_map(metric, region, yr):
         Selection from statistic of interest filter
     yr: integer
         Year for which the data is displayed, from Year filter
+    data: DataFrame, optional
+        The data filtered on these selections, when already at hand
     Returns
     --------
     chart
@@ -438,10 +1108,10 @@ def plot_world_map(metric, region, yr):
     --------
     > plot_world_map("child_mortality", "Asia", 2015)
     """
-    world = data.world_110m()
-    world_map = alt.topo_feature(data.world_110m.url, "countries")
-    alt.data_transformers.disable_max_rows()
-    df = filter_data(region, None, None, yr)
+    world_map = alt.topo_feature(world_url, "countries")
+    if data is None:
+        data = filter_data(region, None, None, yr)
+    df, decode = compact_data(data[["id", "country", metric]])
 
     if region is None:
 
@@ -452,56 +1122,40 @@ def plot_world_map(metric, region, yr):
                 lookup="id",
                 from_=alt.LookupData(df, key="id", fields=["country", metric]),
             )
+            .transform_calculate(**decode)
             .encode(
                 tooltip=["country:O", metric + ":Q"],
                 color=alt.Color(metric + ":Q", title=metrics[metric]),
             )
-            .properties(width=900, height=350)
+            .properties(width=MAP_WIDTH, height=MAP_HEIGHT)
         )
 
     else:
-        scl = None
-        trans = None
-        if region == "Europe":
-            scl = 800
-            trans = [150, 1010]
-        elif region == "Asia":
-            scl = 500
-            trans = [-100, 500]
-        elif region == "Africa":
-            scl = 500
-            trans = [400, 300]
-        elif region == "Americas":
-            scl = 300
-            trans = [1000, 350]
-        elif region == "Oceania":
-            scl = 500
-            trans = [-400, 0]
+        region_map = alt.Data(
+            url=region_urls[region], format=alt.DataFormat(type="json", property="features")
+        )
         chart = (
-            alt.Chart(world_map, title=f"{metrics[metric]} by country for year {yr}")
+            alt.Chart(region_map, title=f"{metrics[metric]} by country for year {yr}")
             .mark_geoshape(stroke="black")
             .transform_lookup(
                 lookup="id",
                 from_=alt.LookupData(df, key="id", fields=["country", metric]),
             )
+            .transform_calculate(**decode)
             .encode(
                 tooltip=["country:O", metric + ":Q"],
                 color=alt.Color(metric + ":Q", title=metrics[metric]),
             )
-            .project(type="naturalEarth1", scale=scl, translate=trans)
-            .properties(width=900, height=350)
+            # the geometry is already projected and fitted to the map size
+            .project(type="identity", scale=1, translate=[0, 0])
+            .properties(width=MAP_WIDTH, height=MAP_HEIGHT)
         )
-    return chart.to_html()
+    return render_chart(chart)
 
 
-@app.callback(
-    Output("boxplot", "srcDoc"),
-    Input("metric", "value"),
-    Input("region", "value"),
-    Input("sub_region", "value"),
-    Input("yr", "value"),
-)
-def plot_box_plot(metric, region, sub_region, yr):
+@chart_cache.memoize
+@render_pool.offload
+def plot_box_plot(metric, region, sub_region, country, yr, data=None):
     """
     Create box chart for statsitic of interested based on selected filters for income groups
     Parameters
@@ -512,8 +1166,12 @@ def plot_box_plot(metric, region, sub_region, yr):
         Selection from the region filter
     sub_region: string
         Selection from sub region filter
+    country: string
+        Selection from country filter
     yr: integer
         Year for which the data is displayed, from Year filter
+    data: DataFrame, optional
+        The data filtered on these selections, when already at hand
     Returns
     --------
     chart
@@ -521,48 +1179,74 @@ def plot_box_plot(metric, region, sub_region, yr):
         in specific region, subregion and year
     Example
     --------
-    > plot_box_plot("child_mortality", "Asia", "Western Asia", 2015)
+    > plot_box_plot("child_mortality", "Asia", "Western Asia", None, 2015)
     """
-    alt.data_transformers.disable_max_rows()
+    # filter by region, sub-region, country & year
+    if data is None:
+        data = filter_data(region, sub_region, country, yr)
 
-    # filter by region, sub-region & year
-    data = filter_data(region, sub_region, None, yr)
+    stats, outliers = boxplot_stats(data, metric)
+    # quartiles fall between the values, keep a digit more of them
+    stats, decode_stats = compact_data(stats, digits=dict.fromkeys(stats.columns, 4))
+    outliers, decode_outliers = compact_data(outliers)
 
-    data = data[data["income_group"].notnull()]
+    x = alt.X("income_group:N", sort="descending", title="Income Group")
+    color = alt.Color(
+        "income_group:N",
+        sort=alt.EncodingSortField("income_group", order="descending"),
+        title="Income Group",
+    )
+    title = metrics[metric]
+    scale = alt.Scale(zero=False)
+    base = alt.Chart().encode(x)
+    whiskers = base.mark_rule().encode(
+        alt.Y("lower:Q", title=title, scale=scale), alt.Y2("upper:Q")
+    )
+    box = base.mark_bar(size=50).encode(
+        alt.Y("q1:Q", title=title, scale=scale),
+        alt.Y2("q3:Q"),
+        color=color,
+        tooltip=[
+            alt.Tooltip("upper:Q", title="Upper whisker"),
+            alt.Tooltip("q3:Q", title="Q3"),
+            alt.Tooltip("median:Q", title="Median"),
+            alt.Tooltip("q1:Q", title="Q1"),
+            alt.Tooltip("lower:Q", title="Lower whisker"),
+        ],
+    )
+    median = base.mark_tick(size=50, color="white").encode(
+        alt.Y("median:Q", title=title, scale=scale)
+    )
+    points = (
+        alt.Chart(outliers)
+        .transform_calculate(**decode_outliers)
+        .mark_point()
+        .encode(
+            x,
+            alt.Y(metric + ":Q", title=title, scale=scale),
+            color=color,
+            tooltip=["country:O", metric + ":Q"],
+        )
+    )
 
     chart = (
-        alt.Chart(
-            data,
+        alt.layer(
+            # the summary layers share their data and its decoding
+            alt.layer(whiskers, box, median, data=stats).transform_calculate(**decode_stats),
+            points,
             title=f"{metrics[metric]} by Income Group for year {yr}",
         )
-        .mark_boxplot(size=50)
-        .encode(
-            alt.X("income_group", sort="-x", title="Income Group"),
-            alt.Y(metric, title=metrics[metric], scale=alt.Scale(zero=False)),
-            color=alt.Color(
-                "income_group",
-                sort=alt.EncodingSortField("income_group", order="descending"),
-                title="Income Group",
-            ),
-            tooltip=("name:O", "child_mortality:Q"),
-        )
         .configure_axis(labelFontSize=12, titleFontSize=14)
         .configure_legend(labelFontSize=12)
         .properties(width=450, height=300)
         .configure_legend(gradientLength=900, gradientThickness=400)
-
     )
-    return chart.to_html()
+    return render_chart(chart)
 
 
-@app.callback(
-    Output("bubblechart", "srcDoc"),
-    Input("metric", "value"),
-    Input("region", "value"),
-    Input("sub_region", "value"),
-    Input("yr", "value"),
-)
-def plot_bubble_chart(metric, region, sub_region, yr):
+@chart_cache.memoize
+@render_pool.offload
+def plot_bubble_chart(metric, region, sub_region, country, yr, data=None):
     """
     Create bubble chart for statsitic of interested based on selected filters vs GDP
     Parameters
@@ -573,8 +1257,12 @@ def plot_bubble_chart(metric, region, sub_region, yr):
         Selection from the region filter
     sub_region: string
         Selection from sub region filter
+    country: string
+        Selection from country filter
     yr: integer
         Year for which the data is displayed, from Year filter
+    data: DataFrame, optional
+        The data filtered on these selections, when already at hand
     Returns
     --------
     chart
@@ -582,38 +1270,44 @@ def plot_bubble_chart(metric, region, sub_region, yr):
         in specific region, subregion and year vs GDP.
     Example
     --------
-    > plot_bubble_chart("child_mortality", "Asia", "Western Asia", 2015)
+    > plot_bubble_chart("child_mortality", "Asia", "Western Asia", None, 2015)
     """
-    df = filter_data(region, sub_region, None, yr)
+    if data is None:
+        data = filter_data(region, sub_region, country, yr)
+    df, decode = compact_data(
+        data[["region", "sub_region", "country", "log_income", "income", "population", metric]],
+        digits={"log_income": 4},
+    )
 
     if region is not None and sub_region is None:
         chart = (
             (
                 alt.Chart(df, title=f"{metrics[metric]} vs. GDP per Capita ($USD)")
+                .transform_calculate(**decode)
                 .mark_circle()
                 .encode(
                     alt.X(
-                        "log_income",
+                        "log_income:Q",
                         title="GDP per Capita ($USD Log Scale)",
                         scale=alt.Scale(zero=False),
                     ),
                     alt.Y(
-                        metric,
+                        metric + ":Q",
                         title=metrics[metric],
                         scale=alt.Scale(zero=False),
                     ),
                     alt.Size(
-                        "population",
+                        "population:Q",
                         title="Population",
                         scale=alt.Scale(range=(10, 1000)),
                     ),
-                    alt.Color("sub_region", title="Sub Continent"),
+                    alt.Color("sub_region:N", title="Sub Continent"),
                     tooltip=[
-                        alt.Tooltip("region", title="Continent"),
-                        alt.Tooltip("sub_region", title="Sub region"),
-                        alt.Tooltip("country", title="Country"),
-                        alt.Tooltip(metric, title=metrics[metric]),
-                        alt.Tooltip("income", title="GDP per Capita", format=","),
+                        alt.Tooltip("region:N", title="Continent"),
+                        alt.Tooltip("sub_region:N", title="Sub region"),
+                        alt.Tooltip("country:N", title="Country"),
+                        alt.Tooltip(metric + ":Q", title=metrics[metric]),
+                        alt.Tooltip("income:Q", title="GDP per Capita", format=","),
                     ],
                 )
                 .configure_axis(titleFontSize=14)
@@ -626,30 +1320,31 @@ def plot_bubble_chart(metric, region, sub_region, yr):
         chart = (
             (
                 alt.Chart(df, title=f"{metrics[metric]} vs. GDP per Capita ($USD)")
+                .transform_calculate(**decode)
                 .mark_circle()
                 .encode(
                     alt.X(
-                        "log_income",
+                        "log_income:Q",
                         title="GDP per Capita ($USD Log Scale)",
                         scale=alt.Scale(zero=False),
                     ),
                     alt.Y(
-                        metric,
+                        metric + ":Q",
                         title=metrics[metric],
                         scale=alt.Scale(zero=False),
                     ),
                     alt.Size(
-                        "population",
+                        "population:Q",
                         title="Population",
                         scale=alt.Scale(range=(10, 1000)),
                     ),
-                    alt.Color("region", title="Continent"),
+                    alt.Color("region:N", title="Continent"),
                     tooltip=[
-                        alt.Tooltip("region", title="Continent"),
-                        alt.Tooltip("sub_region", title="Sub region"),
-                        alt.Tooltip("country", title="Country"),
-                        alt.Tooltip(metric, title=metrics[metric]),
-                        alt.Tooltip("income", title="GDP per Capita", format=","),
+                        alt.Tooltip("region:N", title="Continent"),
+                        alt.Tooltip("sub_region:N", title="Sub region"),
+                        alt.Tooltip("country:N", title="Country"),
+                        alt.Tooltip(metric + ":Q", title=metrics[metric]),
+                        alt.Tooltip("income:Q", title="GDP per Capita", format=","),
                     ],
                 )
                 .configure_axis(titleFontSize=14)
@@ -657,34 +1352,35 @@ def plot_bubble_chart(metric, region, sub_region, yr):
             .properties(width=300, height=300)
             .configure_legend(gradientLength=900, gradientThickness=400)
         )
-    elif region is not None and sub_region is not None:
+    else:
         chart = (
             (
                 alt.Chart(df, title=f"{metrics[metric]} vs. GDP per Capita ($USD)")
+                .transform_calculate(**decode)
                 .mark_circle()
                 .encode(
                     alt.X(
-                        "log_income",
+                        "log_income:Q",
                         title="GDP per Capita ($USD Log Scale)",
                         scale=alt.Scale(zero=False),
                     ),
                     alt.Y(
-                        metric,
+                        metric + ":Q",
                         title=metrics[metric],
                         scale=alt.Scale(zero=False),
                     ),
                     alt.Size(
-                        "population",
+                        "population:Q",
                         title="Population",
                         scale=alt.Scale(range=(10, 1000)),
                     ),
-                    alt.Color("country", title="Country"),
+                    alt.Color("country:N", title="Country"),
                     tooltip=[
-                        alt.Tooltip("region", title="Continent"),
-                        alt.Tooltip("sub_region", title="Sub region"),
-                        alt.Tooltip("country", title="Country"),
-                        alt.Tooltip(metric, title=metrics[metric]),
-                        alt.Tooltip("income", title="GDP per Capita", format=","),
+                        alt.Tooltip("region:N", title="Continent"),
+                        alt.Tooltip("sub_region:N", title="Sub region"),
+                        alt.Tooltip("country:N", title="Country"),
+                        alt.Tooltip(metric + ":Q", title=metrics[metric]),
+                        alt.Tooltip("income:Q", title="GDP per Capita", format=","),
                     ],
                 )
                 .configure_axis(titleFontSize=14)
@@ -693,20 +1389,14 @@ def plot_bubble_chart(metric, region, sub_region, yr):
             .configure_legend(gradientLength=900, gradientThickness=400)
         )
 
-    return chart.to_html()
+    return render_chart(chart)
 
 
-@app.callback(
-    Output("barchart", "srcDoc"),
-    Input("metric", "value"),
-    Input("region", "value"),
-    Input("radio", "value"),
-    Input("sub_region", "value"),
-    Input("yr", "value"),
-)
+@chart_cache.memoize
+@render_pool.offload
 def plot_bar_chart(metric, region, radio, sub_region, yr):
     """
-    Create a bar chart for top 10 countries in terms of life expectancy.
+    Create a bar chart of the top (or bottom) 10 countries by a metric.
     Parameters
     --------
     metric: string
@@ -725,32 +1415,314 @@ def plot_bar_chart(metric, region, radio, sub_region, yr):
         The bar chart that shows top 10 countries for filters selected
     Example
     --------
-    > plot_bar_chart("child_mortality", "Asia", "Western Asia", 2015)
+    > plot_bar_chart("child_mortality", "Asia", "Top", "Western Asia", 2015)
     """
-    data = filter_data(region, sub_region, None, yr)
-    if radio == "Top":
-        order="descending"
-    else:
-        order="ascending"
+    data, decode = compact_data(rank_countries(metric, region, sub_region, yr, radio))
     country = (
-        alt.Chart(data, title=f"{metrics[metric]} - {radio} 10 Countries for Year {yr}")
+        alt.Chart(
+            data, title=f"{metrics[metric]} - {radio} {RANK_COUNT} Countries for Year {yr}"
+        )
+        .transform_calculate(**decode)
         .mark_bar()
         .encode(
-            y=alt.Y("country", sort="-x", title="Country"),
-            x=alt.X(metric, title=metrics[metric]),
+            # in ranking order
+            y=alt.Y("country:N", sort=None, title="Country"),
+            x=alt.X(metric + ":Q", title=metrics[metric]),
             color=alt.Color(metric + ":Q", title=metrics[metric]),
             tooltip=("country:O", metric + ":Q")
         )
-        .transform_window(
-            rank="rank(life_expectancy)",
-            sort=[alt.SortField(metric, order=order)],
-        )
-        .transform_filter((alt.datum.rank < 10))
     ).properties(width=410, height=300)
 
 
-    return country.to_html()
+    return render_chart(country)
+
+
+@chart_cache.memoize
+@render_pool.offload
+def plot_world_map_years(metric, region, yr):
+    """
+    Create world heatmap for statsitic of interest for every year, with a
+    slider to choose the year in the browser.
+    Parameters
+    --------
+    metric: string
+        Selection from statistic of interest filter
+    region: string
+        Selection from the region filter
+    yr: integer
+        Year the slider starts at
+    Returns
+    --------
+    chart
+        World heatmap for statistic of interest, for every year
+    Example
+    --------
+    > plot_world_map_years("child_mortality", "Asia", 2015)
+    """
+    df = filter_years(region, None, None, *ANIMATION_YEARS)[["id", "country", "year", metric]]
+    df = df[df[metric].notnull()]
+    data, decode = compact_data(df)
+    if region is None:
+        geo = alt.topo_feature(world_url, "countries")
+    else:
+        geo = alt.Data(
+            url=region_urls[region], format=alt.DataFormat(type="json", property="features")
+        )
+    year = year_selection(yr)
+
+    chart = (
+        alt.Chart(data, title=f"{metrics[metric]} by country")
+        .mark_geoshape(stroke="black")
+        .add_selection(year)
+        .transform_filter(year)
+        .transform_lookup(
+            lookup="id", from_=alt.LookupData(geo, key="id", fields=["type", "geometry"])
+        )
+        .transform_calculate(**decode)
+        .encode(
+            tooltip=["country:O", "year:O", metric + ":Q"],
+            color=alt.Color(
+                metric + ":Q", title=metrics[metric], scale=alt.Scale(domain=value_domain(df[metric]))
+            ),
+        )
+        .properties(width=MAP_WIDTH, height=MAP_HEIGHT)
+    )
+    if region is not None:
+        # the geometry is already projected and fitted to the map size
+        chart = chart.project(type="identity", scale=1, translate=[0, 0])
+    return render_chart(chart)
+
+
+@chart_cache.memoize
+@render_pool.offload
+def plot_bubble_chart_years(metric, region, sub_region, country, yr):
+    """
+    Create bubble chart for statsitic of interested vs GDP for every year,
+    with a slider to choose the year in the browser.
+    Parameters
+    --------
+    metric: string
+        Selection from statistic of interest filter
+    region: string
+        Selection from the region filter
+    sub_region: string
+        Selection from sub region filter
+    country: string
+        Selection from country filter
+    yr: integer
+        Year the slider starts at
+    Returns
+    --------
+    chart
+        Bubble chart showing statistic of interest vs GDP, for every year
+    Example
+    --------
+    > plot_bubble_chart_years("child_mortality", "Asia", "Western Asia", None, 2015)
+    """
+    df = filter_years(region, sub_region, country, *ANIMATION_YEARS)[
+        ["region", "sub_region", "country", "year", "log_income", "income", "population", metric]
+    ]
+    if region is not None and sub_region is None:
+        color, width = alt.Color("sub_region:N", title="Sub Continent"), 420
+    elif region is None and sub_region is None:
+        color, width = alt.Color("region:N", title="Continent"), 300
+    else:
+        color, width = alt.Color("country:N", title="Country"), 300
+    data, decode = compact_data(df, digits={"log_income": 4})
+    year = year_selection(yr)
+
+    chart = (
+        alt.Chart(data, title=f"{metrics[metric]} vs. GDP per Capita ($USD)")
+        .transform_calculate(**decode)
+        .mark_circle()
+        .add_selection(year)
+        .transform_filter(year)
+        .encode(
+            alt.X(
+                "log_income:Q",
+                title="GDP per Capita ($USD Log Scale)",
+                scale=alt.Scale(zero=False, domain=value_domain(df["log_income"])),
+            ),
+            alt.Y(
+                metric + ":Q",
+                title=metrics[metric],
+                scale=alt.Scale(zero=False, domain=value_domain(df[metric])),
+            ),
+            alt.Size(
+                "population:Q",
+                title="Population",
+                scale=alt.Scale(range=(10, 1000), domain=value_domain(df["population"])),
+            ),
+            color,
+            tooltip=[
+                alt.Tooltip("region:N", title="Continent"),
+                alt.Tooltip("sub_region:N", title="Sub region"),
+                alt.Tooltip("country:N", title="Country"),
+                alt.Tooltip("year:O", title="Year"),
+                alt.Tooltip(metric + ":Q", title=metrics[metric]),
+                alt.Tooltip("income:Q", title="GDP per Capita", format=","),
+            ],
+        )
+        .configure_axis(titleFontSize=14)
+        .properties(width=width, height=300)
+    )
+    return render_chart(chart)
+
+
+@chart_cache.memoize
+@render_pool.offload
+def plot_country_trends(metric, countries):
+    """
+    Create a line chart of the trajectories of a metric across all years,
+    for a set of countries.
+    Parameters
+    --------
+    metric: string
+        Selection from statistic of interest filter
+    countries: tuple
+        Country names, sorted so that a set of countries is cached once
+    Returns
+    --------
+    chart
+        Line chart of the statistic of interest of each country, by year
+    Example
+    --------
+    > plot_country_trends("child_mortality", ("China", "India"))
+    """
+    df = country_trends(metric, countries)
+    data, decode = compact_data(df)
+    chart = (
+        alt.Chart(data, title=f"{metrics[metric]} by Year")
+        .transform_calculate(**decode)
+        .mark_line()
+        .encode(
+            alt.X("year:Q", title="Year", axis=alt.Axis(format="d")),
+            alt.Y(metric + ":Q", title=metrics[metric], scale=alt.Scale(zero=False)),
+            alt.Color("country:N", title="Country"),
+            tooltip=[
+                alt.Tooltip("country:N", title="Country"),
+                alt.Tooltip("year:Q", title="Year", format="d"),
+                alt.Tooltip(metric + ":Q", title=metrics[metric]),
+            ],
+        )
+        .configure_axis(titleFontSize=14)
+        .properties(width=800, height=300)
+    )
+    return render_chart(chart)
+
+
+@app.callback(
+    chart_output("trends"),
+    Input("metric", "value"),
+    Input("trend_countries", "value"),
+)
+def update_country_trends(metric, countries):
+    """
+    Redraw the drill-down of the first TREND_MAX_COUNTRIES countries
+    selected, whatever order they were selected in.
+    """
+    countries = tuple(sorted((countries or [])[:TREND_MAX_COUNTRIES]))
+    return plot_country_trends(metric, countries)
+
+
+# the callback inputs each chart is drawn from, and the tab each tab chart is on;
+# animated charts are drawn from every year, whatever the year selected
+CHART_INPUTS = {
+    "worldmap": {"metric", "region", "yr", "animate"},
+    "boxplot": {"metric", "region", "sub_region", "country", "yr"},
+    "bubblechart": {"metric", "region", "sub_region", "country", "yr", "animate"},
+    "barchart": {"metric", "region", "radio", "sub_region", "yr"},
+}
+TAB_CHARTS = {"gdp": "bubblechart", "income": "boxplot"}
+
+
+@app.callback(
+    [chart_output(chart_id) for chart_id in CHART_INPUTS],
+    Output("drawn", "data"),
+    Input("metric", "value"),
+    Input("region", "value"),
+    Input("radio", "value"),
+    Input("sub_region", "value"),
+    Input("country", "value"),
+    Input("yr", "value"),
+    Input("tabs", "active_tab"),
+    Input("animate", "value"),
+    State("drawn", "data"),
+    State("session", "data"),
+)
+def update_charts(metric, region, radio, sub_region, country, yr, tab, animate, drawn, session):
+    """
+    Redraw, in a single request, every visible chart whose inputs differ
+    from the ones it was last drawn with, filtering the data once for all
+    of them. The chart on the hidden tab is only drawn once its tab is
+    shown, and switching back to a tab whose chart is up to date redraws
+    nothing. In animation mode, the world map and bubble chart hold every
+    year and are not redrawn when the year changes. A newer request from
+    the same session supersedes this one before it draws its next chart.
+    Returns
+    --------
+    charts, drawn
+        The serialized world map, boxplot, bubble chart and bar chart, or
+        no_update for those left as is, and the inputs each chart is now
+        drawn with
+    """
+    inputs = {
+        "metric": metric,
+        "region": region,
+        "radio": radio,
+        "sub_region": sub_region,
+        "country": country,
+        "yr": yr,
+        "animate": bool(animate),
+    }
+    # charts drawn from an older version of the data are redrawn too
+    version = datasets.active().version
+    drawn = dict(drawn or {})
+    stale = []
+    for chart_id, names in CHART_INPUTS.items():
+        if chart_id in TAB_CHARTS.values() and TAB_CHARTS.get(tab) != chart_id:
+            continue
+        if animate and "animate" in names:
+            names = names - {"yr"}
+        key = [version, *(normalize_arg(inputs[name]) for name in sorted(names))]
+        if drawn.get(chart_id) != key:
+            drawn[chart_id] = key
+            stale.append(chart_id)
+    if not stale:
+        raise PreventUpdate
+
+    token = chart_requests.start(session)
+    triggered = {t["prop_id"].split(".")[0] for t in callback_context.triggered}
+    if CALLBACK_DEBOUNCE and triggered and triggered <= {"yr", "metric"}:
+        time.sleep(CALLBACK_DEBOUNCE)
+
+    data = filter_data(region, sub_region, country, yr)
+    # the world map ignores the sub region and the country
+    region_data = data if not (sub_region or country) else filter_data(region, None, None, yr)
+    plots = {
+        "worldmap": lambda: plot_world_map(metric, region, yr, data=region_data),
+        "boxplot": lambda: plot_box_plot(metric, region, sub_region, country, yr, data=data),
+        "bubblechart": lambda: plot_bubble_chart(
+            metric, region, sub_region, country, yr, data=data
+        ),
+        "barchart": lambda: plot_bar_chart(metric, region, radio, sub_region, yr),
+    }
+    if animate:
+        plots["worldmap"] = lambda: plot_world_map_years(metric, region, yr)
+        plots["bubblechart"] = lambda: plot_bubble_chart_years(
+            metric, region, sub_region, country, yr
+        )
+    charts = []
+    for chart_id in CHART_INPUTS:
+        if chart_id not in stale:
+            charts.append(no_update)
+            continue
+        if chart_requests.is_superseded(session, token):
+            raise PreventUpdate
+        charts.append(plots[chart_id]())
+    return [*charts, drawn]
 
 
 if __name__ == "__main__":
+    datasets.watch(DATA_RELOAD_INTERVAL)
     app.run_server(debug=os.environ.get("IS_DEBUG", False))
@@ -0,0 +1,47 @@
+// Client-side options of the geography dropdowns, looked up in the region
+// -> sub region -> country hierarchy the layout embeds in the "geography"
+// store, so that choosing a continent or sub continent costs no request.
+(function () {
+    function options(names) {
+        return names.map(function (name) {
+            return {label: name, value: name};
+        });
+    }
+
+    function subRegions(region, hierarchy) {
+        if (region) {
+            return hierarchy.regions[region] || [];
+        }
+        return [].concat.apply([], Object.values(hierarchy.regions));
+    }
+
+    function countries(region, subRegion, hierarchy) {
+        const names = subRegion ? [subRegion] : subRegions(region, hierarchy);
+        return [].concat.apply([], names.map(function (sr) {
+            return hierarchy.sub_regions[sr] || [];
+        }));
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        geography: {
+            sub_regions: function (region, hierarchy) {
+                return options(subRegions(region, hierarchy));
+            },
+            // options of the country filter, and its value, kept if still offered
+            countries: function (region, subRegion, selected, hierarchy) {
+                const names = countries(region, subRegion, hierarchy).sort();
+                return [options(names), names.indexOf(selected) < 0 ? null : selected];
+            },
+            // countries of the selected geography, and those already selected
+            countries_with_selected: function (region, subRegion, selected, hierarchy) {
+                const names = countries(region, subRegion, hierarchy);
+                (selected || []).forEach(function (name) {
+                    if (names.indexOf(name) < 0) {
+                        names.push(name);
+                    }
+                });
+                return options(names.sort());
+            },
+        },
+    });
+})();
@@ -0,0 +1,25 @@
+// Client-side rendering of the Vega-Lite specs sent by the plotting
+// callbacks when the app runs with CHART_RENDERER=vega. The Vega runtime is
+// loaded once with the page and every chart container keeps its view, which
+// is finalized before the next spec is embedded.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    charts: {
+        render: function (spec, id) {
+            const el = document.getElementById(id);
+            if (!spec || !el || typeof vegaEmbed === "undefined") {
+                return window.dash_clientside.no_update;
+            }
+            if (el._vegaView) {
+                el._vegaView.finalize();
+            }
+            vegaEmbed(el, JSON.parse(spec), {actions: false})
+                .then(function (result) {
+                    el._vegaView = result.view;
+                })
+                .catch(function (error) {
+                    el.innerHTML = '<p style="color:red;">' + error.message + "</p>";
+                });
+            return window.dash_clientside.no_update;
+        },
+    },
+});
@@ -0,0 +1,234 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ChartCache:
+    """
+    Thread-safe, size-bounded LRU cache for rendered charts.
+
+    Entries are evicted least recently used first whenever either the
+    number of entries exceeds `max_entries` or the total size of the cached
+    values exceeds `max_bytes`.
+    Parameters
+    --------
+    max_entries: int
+        Maximum number of cached charts
+    max_bytes: int
+        Maximum total size of the cached charts, in bytes
+    store: ChartStore, optional
+        Pre-rendered charts consulted on a miss before rendering
+    version: callable, optional
+        Returns the version of the charts drawn, which every key is
+        prefixed with, so that the charts of a version can be dropped with
+        `invalidate` once it is no longer served
+    current: callable, optional
+        Returns the version currently served: entries of any other version,
+        set by requests still finishing on an older one, are not kept
+    Example
+    --------
+    > cache = ChartCache(max_entries=512, max_bytes=64 * 2**20)
+    > @cache.memoize
+    > def plot(metric, yr): ...
+    """
+
+    def __init__(
+        self, max_entries=1024, max_bytes=256 * 2**20, store=None, version=None, current=None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self.version = version
+        self.current = current
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        key = self._versioned(key)
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        key = self._versioned(key)
+        size = _sizeof(value)
+        with self._lock:
+            # checked under the lock, so that an entry is either set before
+            # its version is invalidated, or not at all
+            if size > self.max_bytes or self._stale(key):
+                return
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, version):
+        """Drop the entries of a version."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == version]:
+                self.nbytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def memoize(self, func):
+        """
+        Decorate a plotting function so that its output is cached on the
+        normalized positional arguments it was called with. Keyword
+        arguments are passed through but are not part of the key, so they
+        may only carry values derived from the positional ones (e.g. the
+        already filtered data).
+        """
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, *map(normalize_arg, args))
+            value = self.get(key)
+            if value is not None:
+                return value
+            store = self.store
+            if store is not None and (self.version is None or store.version == self.version()):
+                value = store.get(key)
+            if value is None:
+                value = func(*args, **kwargs)
+            self.set(key, value)
+            return value
+
+        return wrapper
+
+    def _stale(self, key):
+        return self.version is not None and self.current is not None and key[0] != self.current()
+
+    def _versioned(self, key):
+        return key if self.version is None else (self.version(), *key)
+
+
+class ChartStore:
+    """
+    Content-addressed on-disk store of pre-rendered charts.
+
+    Each rendered chart is written once to `objects/<sha256>.html`, and a
+    manifest maps every cache key to the digest of its chart. The manifest
+    is read once when the store is opened, so serving a chart costs a
+    single file read. A store built from a different version of the data,
+    or by different code, is ignored.
+    Parameters
+    --------
+    root: string
+        Directory holding the manifest and the chart objects
+    version: string
+        Version of the data and code the charts must have been rendered
+        with, see app.chart_version
+    Example
+    --------
+    > store = ChartStore("build/charts", chart_version(data_version))
+    > store.get(("plot_world_map", "life_expectancy", None, 2010))
+    """
+
+    def __init__(self, root, version):
+        self.root = root
+        self.version = version
+        self._index = {}
+        try:
+            with open(os.path.join(root, "manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("version") == version:
+            self._index = manifest["charts"]
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key):
+        digest = self._index.get(store_key(key))
+        if digest is None:
+            return None
+        try:
+            with open(self._path(digest), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write(self, charts):
+        """
+        Write an iterable of (key, chart) pairs to the store and replace the
+        manifest atomically once every chart is on disk.
+        """
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        index = {}
+        for key, chart in charts:
+            digest = hashlib.sha256(chart.encode()).hexdigest()
+            path = self._path(digest)
+            if not os.path.exists(path):
+                _write_atomic(path, chart)
+            index[store_key(key)] = digest
+        manifest = {"version": self.version, "charts": index}
+        _write_atomic(os.path.join(self.root, "manifest.json"), json.dumps(manifest))
+        self._index = index
+
+    def _path(self, digest):
+        return os.path.join(self.root, "objects", digest + ".html")
+
+
+def store_key(key):
+    """Serialize a cache key to the string used in the store manifest."""
+    return json.dumps(key)
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def normalize_arg(value):
+    """
+    Map equivalent callback inputs to the same cache key, e.g. a cleared
+    dropdown ("" or None) and integral floats coming from the slider.
+    """
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _sizeof(value):
+    if isinstance(value, str):
+        return len(value.encode())
+    return len(value)
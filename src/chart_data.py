@@ -0,0 +1,69 @@
+"""
+Compact encoding of the data the charts inline into their specs.
+
+Altair inlines a DataFrame as JSON records, which repeats every column name
+and string value on each row and writes floats with full precision. Here
+the data is inlined as CSV instead (the column names once), categorical
+columns with repeated values are replaced by their integer codes and
+decoded by a calculate transform holding their categories once, and floats are rounded to the
+precision they are displayed with.
+"""
+import json
+
+import altair as alt
+import numpy as np
+
+# significant digits floats are inlined with, the precision of the source data
+SIGNIFICANT_DIGITS = 3
+
+
+def round_significant(values, digits):
+    """Round an array of floats to a number of significant digits."""
+    values = np.asarray(values, dtype=float)
+    magnitude = np.floor(np.log10(np.where(values == 0, 1, np.abs(values))))
+    scale = 10 ** (digits - 1 - np.nan_to_num(magnitude))
+    return np.round(values * scale) / scale
+
+
+def compact_data(df, digits=None):
+    """
+    Encode a DataFrame as compact inline data for a chart.
+    Parameters
+    --------
+    df: DataFrame
+        Data to inline, with categorical string columns
+    digits: dict, optional
+        Significant digits of float columns, SIGNIFICANT_DIGITS by default
+    Returns
+    --------
+    data, decode
+        Inline CSV data, and the calculate expressions restoring the
+        categorical columns, to be applied with transform_calculate
+        wherever the data is used
+    Example
+    --------
+    > data, decode = compact_data(df)
+    > alt.Chart(data).transform_calculate(**decode).mark_bar()
+    """
+    digits = digits or {}
+    columns, decode = {}, {}
+    for col in df:
+        values = df[col]
+        if values.dtype.name == "category" and values.nunique() < len(values):
+            # only worth it for values repeated on several rows
+            values = values.cat.remove_unused_categories()
+            codes = values.cat.codes.to_numpy()
+            columns[col] = np.where(codes < 0, np.nan, codes)
+            categories = ",".join(json.dumps(str(c)) for c in values.cat.categories)
+            decode[col] = f"isValid(datum.{col}) ? [{categories}][datum.{col}] : null"
+        elif values.dtype.name == "category":
+            columns[col] = values.astype(object).to_numpy()
+        elif values.dtype.kind == "f":
+            columns[col] = round_significant(values, digits.get(col, SIGNIFICANT_DIGITS))
+        else:
+            columns[col] = values.to_numpy()
+    text = df.assign(**columns).to_csv(index=False, float_format="%g")
+    # strings are left as they are
+    parse = {col: "number" for col, values in columns.items() if values.dtype.kind in "biuf"}
+    data = alt.InlineData(values=text, format=alt.DataFormat(type="csv", parse=parse))
+    return data, decode
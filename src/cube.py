@@ -0,0 +1,127 @@
+"""
+Dense in-memory model of the merged gapminder data.
+
+Every numeric column is held as a float32 array indexed by year and country,
+in one read-only (column, year, country) array. Countries are ordered by
+continent, sub continent and name, so that every continent, sub continent
+and country is a contiguous range of country ordinals: any (column,
+geography, year) lookup is a view into the array, found by integer
+indexing alone.
+
+The charts take DataFrames, so the cube also exposes its values as one long
+frame, one row per year and country, whose numeric columns are views of the
+same memory: the rows of a geography in a year are a contiguous block of it.
+"""
+import numpy as np
+import pandas as pd
+
+# columns describing each country rather than each year
+COUNTRY_COLUMNS = ["id", "country", "region", "sub_region", "income_group"]
+
+
+class DataCube:
+    """
+    Column x year x country cube of the merged data.
+    Parameters
+    --------
+    df: DataFrame
+        Merged gapminder data, with at most one row per country and year
+    columns: list
+        Numeric columns to hold in the cube
+    Example
+    --------
+    > cube = DataCube(gap, ["population", "life_expectancy"])
+    > cube.view("life_expectancy", "region", "Asia", 2010)
+    > cube.select("region", "Asia", 1970, 2010)
+    """
+
+    def __init__(self, df, columns):
+        # the country ids merged in without any data have no year
+        df = df[df["year"].notnull()]
+        self.countries = (
+            df[COUNTRY_COLUMNS]
+            .drop_duplicates("country")
+            .sort_values(["region", "sub_region", "country"])
+            .reset_index(drop=True)
+        )
+        self.years = np.arange(int(df["year"].min()), int(df["year"].max()) + 1)
+        self.columns = {col: i for i, col in enumerate(columns)}
+        ordinals = pd.Series(self.countries.index, index=self.countries["country"])
+        country = ordinals[df["country"]].to_numpy()
+        year = df["year"].to_numpy(dtype=int) - self.years[0]
+        shape = (len(columns), len(self.years), len(self.countries))
+        self.values = np.full(shape, np.nan, dtype=np.float32)
+        self.values[:, year, country] = df[columns].to_numpy(dtype=np.float32).T
+        self.values.flags.writeable = False
+
+        # every geography as a range of country ordinals
+        self.ranges = {(None, None): slice(0, len(self.countries))}
+        for level in ("region", "sub_region", "country"):
+            positions = self.countries.groupby(level, sort=False, observed=True).indices
+            for value, rows in positions.items():
+                self.ranges[(level, value)] = slice(rows[0], rows[-1] + 1)
+
+        # (column, year, country) -> (column, year * country), without a copy
+        numeric = self.values.reshape(len(columns), -1)
+        self.frame = pd.DataFrame(numeric.T, columns=columns, copy=False)
+        attributes = self.countries.iloc[np.tile(np.arange(len(self.countries)), len(self.years))]
+        for i, col in enumerate(COUNTRY_COLUMNS):
+            self.frame.insert(i, col, attributes[col].array)
+        year = np.repeat(self.years, len(self.countries)).astype(np.int16)
+        self.frame.insert(len(COUNTRY_COLUMNS), "year", year)
+
+    def hierarchy(self):
+        """
+        The sub regions of every region and the countries of every sub
+        region, by name, as plain dicts of lists that serialize to JSON.
+        """
+        countries = self.countries.dropna(subset=["region", "sub_region"])
+        regions, sub_regions = {}, {}
+        for (region, sub_region), rows in countries.groupby(
+            ["region", "sub_region"], sort=False, observed=True
+        ):
+            regions.setdefault(region, []).append(sub_region)
+            sub_regions[sub_region] = rows["country"].tolist()
+        return {"regions": regions, "sub_regions": sub_regions}
+
+    def year_index(self, yr):
+        """Position of a year on the year axis, None outside of it."""
+        i = int(yr) - self.years[0]
+        return i if 0 <= i < len(self.years) else None
+
+    def view(self, column, level, value, yr=None):
+        """
+        Values of a column for the countries of a geography, in one year, or
+        as a (year, country) array for every year, without copying them. A
+        year outside the year axis has no values, as it has no rows.
+        """
+        values = self.values[self.columns[column], :, self.ranges[(level, value)]]
+        if yr is None:
+            return values
+        year = self.year_index(yr)
+        if year is None:
+            return values[:0].reshape(-1)
+        return values[year]
+
+    def select(self, level, value, first=None, last=None):
+        """
+        Rows of the frame for the countries of a geography, from year `first`
+        to `last` (every year by default), ordered by year and then country.
+        A single year is a slice of the frame, sharing its memory.
+        Parameters
+        --------
+        level, value: string
+            Geography, (None, None) for the world
+        first, last: int, optional
+            First and last year, included
+        """
+        countries = self.ranges.get((level, value), slice(0, 0))
+        start = 0 if first is None else self.year_index(first)
+        end = len(self.years) - 1 if last is None else self.year_index(last)
+        if start is None or end is None:
+            return self.frame.iloc[0:0]
+        width = len(self.countries)
+        if start == end or countries == self.ranges[(None, None)]:
+            return self.frame.iloc[start * width + countries.start : end * width + countries.stop]
+        years = np.arange(start, end + 1)[:, None] * width
+        return self.frame.iloc[(years + np.arange(countries.start, countries.stop)).ravel()]
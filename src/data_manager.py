@@ -0,0 +1,117 @@
+"""
+Hot reloading of the dataset the app serves.
+
+The dataset is loaded again, in a background thread, when the files it is
+computed from change on disk, and made current at once when fully loaded,
+so that new data is served without restarting the workers. A request pins
+the dataset that was current when it started and is answered from it to
+the end, however long it takes: everything it reads comes from `active()`.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DataManager:
+    """
+    Holder of the current version of a dataset.
+    Parameters
+    --------
+    load: callable
+        Loads the dataset from the files on disk, returning an object with
+        the `version` of the files it was loaded from
+    fingerprint: callable
+        Returns the version of the files on disk, without loading them
+    on_swap: callable, optional
+        Called with the old and the new dataset once the new one is current
+    Example
+    --------
+    > datasets = DataManager(load_dataset, lambda: get_data_version(paths))
+    > datasets.watch(30)
+    > datasets.active().cube
+    """
+
+    def __init__(self, load, fingerprint, on_swap=None):
+        self.load = load
+        self.fingerprint = fingerprint
+        self.on_swap = on_swap
+        self.current = load()
+        self.reloads = 0
+        self._pinned = contextvars.ContextVar("dataset", default=None)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def active(self):
+        """The dataset pinned by the running request, else the current one."""
+        return self._pinned.get() or self.current
+
+    def pin(self):
+        """
+        Pin the current dataset for the rest of the running request,
+        returning the token to unpin it with.
+        """
+        return self._pinned.set(self.current)
+
+    def unpin(self, token):
+        self._pinned.reset(token)
+
+    def reload(self, version=None):
+        """
+        Load the dataset again, unless the files on disk (or `version`, the
+        version wanted) are those of the current one, and make it current.
+        Returns whether another version was loaded.
+        """
+        with self._lock:
+            if (version or self.fingerprint()) == self.current.version:
+                return False
+            dataset = self.load()
+            old = self.current
+            if dataset.version == old.version:
+                return False
+            self.current = dataset
+            self.reloads += 1
+        logger.info("Dataset version %s replaced by %s", old.version, dataset.version)
+        if self.on_swap is not None:
+            self.on_swap(old, dataset)
+        return True
+
+    def watch(self, interval):
+        """
+        Reload the dataset when its files change, checking them every
+        `interval` seconds in a background thread, unless already watching
+        in this process.
+        """
+        with self._lock:
+            if not interval or self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(
+            target=self._watch, args=(interval,), name="dataset-reload", daemon=True
+        ).start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload()
+            except Exception:
+                # e.g. files caught in the middle of being replaced
+                logger.exception("Failed to reload the dataset, retrying in %ss", interval)
+
+    def capture(self):
+        """Version of the active dataset, to render a chart from elsewhere."""
+        return self.active().version
+
+    def restore(self, version):
+        """
+        Make the dataset of a captured version current, in a render process.
+        Returns False when the files on disk are no longer those of that
+        version, which can then only be rendered where it is still loaded.
+        """
+        if version != self.current.version:
+            self.reload(version)
+        return self.current.version == version
@@ -0,0 +1,172 @@
+"""
+Loading of the gapminder data, either from the raw CSV files or from a
+typed columnar snapshot of the merged data.
+
+Run this module to write the snapshot for the current data files:
+    python src/dataset.py [--out DIR]
+"""
+import argparse
+import hashlib
+import os
+
+import pandas as pd
+
+import derived
+
+# string columns are stored as categoricals: integer codes in plain NumPy
+# arrays rather than one Python object per row, so that workers forked from
+# a preloading gunicorn master share them without touching refcounts
+CATEGORICAL_COLUMNS = ["country", "region", "sub_region", "income_group"]
+
+# bump when the layout of the snapshot changes
+SNAPSHOT_SCHEMA = 4
+
+
+def get_data_files(data_dir):
+    """Paths of the raw data files, in the order they are fingerprinted."""
+    return [
+        os.path.join(data_dir, "country_ids.csv"),
+        os.path.join(data_dir, "gapminder.csv"),
+    ]
+
+
+def get_version_files(data_dir):
+    """
+    Paths of the files the merged data is computed from: the raw data files
+    and the definitions of the derived metrics.
+    """
+    return [*get_data_files(data_dir), os.path.abspath(derived.__file__)]
+
+
+def get_data_version(paths):
+    """
+    Fingerprint the data files, so that snapshots and charts built from
+    another version of the data are never used.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def read_csv_data(data_dir):
+    """
+    Read and merge the gapminder and country id CSV files.
+    Parameters
+    --------
+    data_dir: string
+        Directory containing gapminder.csv and country_ids.csv
+    Returns
+    --------
+    data
+        Merged gapminder data with typed columns
+    """
+    ids_path, gap_path = get_data_files(data_dir)
+    country_ids = pd.read_csv(ids_path)
+    gap = pd.read_csv(gap_path)
+    gap = gap.merge(country_ids, how="outer", on=["country"])
+    return optimize_dtypes(derived.add_derived_columns(gap))
+
+
+def optimize_dtypes(df):
+    """
+    Store the string columns as categoricals and downcast numeric columns
+    wherever the values survive the round trip unchanged (e.g. years, but
+    not 72.3 as a float32).
+    """
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    for col in df.select_dtypes("integer"):
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    for col in df.select_dtypes("floating"):
+        downcast = df[col].astype("float32")
+        if downcast.astype(df[col].dtype).equals(df[col]):
+            df[col] = downcast
+    return df
+
+
+def get_snapshot_path(snapshot_dir, version):
+    return os.path.join(snapshot_dir, f"gapminder-{version}.v{SNAPSHOT_SCHEMA}.feather")
+
+
+def write_snapshot(df, path):
+    """
+    Write an uncompressed Feather (Arrow IPC) file, which can be memory
+    mapped when it is read back. Missing values of the float columns are
+    written as NaN rather than as nulls: a column without a validity bitmap
+    is read back as a view of the mapped file instead of a copy.
+    """
+    import pyarrow as pa
+    from pyarrow import feather
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, col in enumerate(table.column_names):
+        if df[col].dtype.kind == "f":
+            table = table.set_column(i, col, pa.array(df[col].to_numpy(), from_pandas=False))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp, compression="uncompressed")
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    """
+    Read a snapshot, its numeric columns as read-only views of the memory
+    mapped file, shared by every process that reads it.
+    """
+    from pyarrow import feather
+
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def load_data(data_dir, snapshot_dir=None):
+    """
+    Load the merged gapminder data from the snapshot matching the current
+    data files, falling back to the CSV files when there is no snapshot or
+    pyarrow is not installed.
+    Parameters
+    --------
+    data_dir: string
+        Directory containing the raw CSV files
+    snapshot_dir: string, optional
+        Directory containing snapshots written by this module
+    Returns
+    --------
+    data, version
+        Merged gapminder data and the fingerprint of the files it is
+        computed from
+    Example
+    --------
+    > gap, data_version = load_data("data", "build/data")
+    """
+    version = get_data_version(get_version_files(data_dir))
+    if snapshot_dir:
+        try:
+            return read_snapshot(get_snapshot_path(snapshot_dir, version)), version
+        except (ImportError, OSError):
+            pass
+    return read_csv_data(data_dir), version
+
+
+def main():
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    parser = argparse.ArgumentParser(description="Write the gapminder data snapshot.")
+    parser.add_argument("--data", default=os.path.join(root, "data"), help="raw data directory")
+    parser.add_argument(
+        "--out",
+        default=os.environ.get("DATA_SNAPSHOT_DIR", os.path.join(root, "build/data")),
+        help="snapshot directory (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    version = get_data_version(get_version_files(args.data))
+    path = get_snapshot_path(args.out, version)
+    write_snapshot(read_csv_data(args.data), path)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Registry of the metrics of the dashboard, raw or derived from other columns.
+
+Derived columns are declared as vectorized expressions over whole columns,
+computed once when the data is loaded from the CSV files and stored with
+the snapshot, so that adding a metric adds no work per request. The metrics
+offered in the control panel, and their labels, come from this registry.
+"""
+import numpy as np
+import pandas as pd
+
+
+class Metric:
+    """
+    A column of the merged data plotted by the dashboard.
+    Parameters
+    --------
+    name: string
+        Column name
+    label: string
+        Title of the metric in the control panel and the charts
+    compute: callable, optional
+        Function of the merged data returning the values of a derived
+        column, for all rows at once; None for a column of the raw data
+    selectable: bool
+        Whether the metric is offered in the control panel
+    Example
+    --------
+    > Metric("co2_emissions", "CO2 Emissions", product("co2_per_capita", "population"))
+    """
+
+    def __init__(self, name, label, compute=None, selectable=True):
+        self.name = name
+        self.label = label
+        self.compute = compute
+        self.selectable = selectable
+
+
+def column(df, col):
+    """Values of a column, or of an expression, as an array of floats."""
+    values = col(df) if callable(col) else df[col]
+    return np.asarray(values, dtype=float)
+
+
+def log(col):
+    """Natural logarithm, missing rather than -inf or NaN with a warning for values <= 0."""
+
+    def compute(df):
+        values = column(df, col)
+        return np.log(np.where(values > 0, values, np.nan))
+
+    return compute
+
+
+def product(*cols):
+    """Product of columns."""
+    return lambda df: np.prod([column(df, col) for col in cols], axis=0)
+
+
+def yearly_change(col):
+    """Change of a column since the previous year, for each country."""
+
+    def compute(df):
+        order, run_start = _country_runs(df)
+        values = column(df, col)[order]
+        change = np.full(len(values), np.nan)
+        follows = run_start[1:] != np.arange(1, len(values))
+        change[1:][follows] = np.diff(values)[follows]
+        return _unsort(change, order)
+
+    return compute
+
+
+def rolling_mean(col, years):
+    """Mean of a column over the last `years` years, for each country."""
+
+    def compute(df):
+        order, run_start = _country_runs(df)
+        values = column(df, col)[order]
+        present = ~np.isnan(values)
+        sums = np.concatenate([[0], np.cumsum(np.where(present, values, 0))])
+        counts = np.concatenate([[0], np.cumsum(present)])
+        end = np.arange(1, len(values) + 1)
+        start = np.maximum(end - years, run_start)
+        count = counts[end] - counts[start]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, (sums[end] - sums[start]) / count, np.nan)
+        return _unsort(mean, order)
+
+    return compute
+
+
+def _country_runs(df):
+    """
+    Order of the rows by country and year, and for each row in that order
+    the position of the first row of its run of consecutive years of the
+    same country.
+    """
+    countries = pd.factorize(df["country"])[0]
+    years = column(df, "year")
+    order = np.lexsort((years, countries))
+    countries, years = countries[order], years[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (countries[1:] != countries[:-1]) | (years[1:] != years[:-1] + 1)
+    run_start = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+    return order, run_start
+
+
+def _unsort(values, order):
+    result = np.empty_like(values)
+    result[order] = values
+    return result
+
+
+METRICS = [
+    Metric("life_expectancy", "Life Expectancy"),
+    Metric("child_mortality", "Child Mortality"),
+    Metric("pop_density", "Population Density"),
+    Metric(
+        "co2_emissions",
+        "CO2 Emissions (tonnes)",
+        product("co2_per_capita", "population"),
+    ),
+    Metric(
+        "life_expectancy_gain",
+        "Life Expectancy Gain (5 Year Average)",
+        rolling_mean(yearly_change("life_expectancy"), 5),
+    ),
+    Metric("log_income", "Log GDP per Capita", log("income"), selectable=False),
+]
+
+
+def add_derived_columns(df, metrics=METRICS):
+    """Add every derived metric to the merged data, in place."""
+    for metric in metrics:
+        if metric.compute is not None:
+            df[metric.name] = metric.compute(df)
+    return df
+
+
+def selectable_metrics(metrics=METRICS):
+    """Labels of the metrics offered in the control panel, by column."""
+    return {metric.name: metric.label for metric in metrics if metric.selectable}
@@ -0,0 +1,52 @@
+"""
+Downsampling of long time series to a fixed number of points.
+
+The data goes back to 1800, so a country's trajectory has over two hundred
+yearly points, more than a line chart a few hundred pixels wide can show.
+Largest-Triangle-Three-Buckets keeps the first and last points and, in
+between, one point per bucket of consecutive points: the one forming the
+largest triangle with the point kept in the previous bucket and the mean of
+the next bucket. Peaks, troughs and turns are kept, so the downsampled line
+looks like the full one.
+"""
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """
+    Positions of the points kept by Largest-Triangle-Three-Buckets.
+    Parameters
+    --------
+    x, y: array
+        Coordinates of the points, without missing values, in increasing x
+    n_out: int
+        Number of points to keep, at least 3
+    Returns
+    --------
+    positions
+        Increasing positions of the kept points, all of them when there are
+        at most n_out
+    Example
+    --------
+    > kept = lttb(years, values, 100)
+    > years[kept], values[kept]
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # n_out - 2 buckets between the first and last points, then the last point
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(int), n)
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end, next_end = edges[i], edges[i + 1], edges[i + 2]
+        cx = x[end:next_end].mean()
+        cy = y[end:next_end].mean()
+        # twice the triangle areas, enough to compare them
+        areas = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
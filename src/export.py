@@ -0,0 +1,102 @@
+"""
+Streaming export of a slice of the data cube, as CSV or Arrow IPC.
+
+An export is generated a few years at a time from the cube's frame, whose
+rows of a year are a contiguous block of it: only one chunk of rows is
+copied at once, so exporting the whole history since 1800 takes no more
+memory than exporting a single year. The bytes of an export only depend on
+the data version and the selection, so that a strong ETag identifies them
+and a byte range of them can be generated again on demand.
+"""
+import hashlib
+import io
+import json
+
+# years of rows formatted at once
+CHUNK_YEARS = 10
+
+# rows are described by these columns, followed by the metrics exported
+ROW_COLUMNS = ["country", "region", "sub_region", "income_group", "year"]
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def export_etag(version, fmt, level, value, first, last, metrics):
+    """ETag of an export, from the data version and the selection."""
+    key = json.dumps([version, fmt, level, value, first, last, metrics])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def iter_chunks(cube, level, value, first, last, metrics):
+    """
+    Rows of a geography from year `first` to `last`, CHUNK_YEARS years at
+    a time, without the rows missing every metric.
+    Parameters
+    --------
+    cube: DataCube
+        The data cube
+    level, value: string
+        Geography, (None, None) for the world
+    first, last: int
+        First and last year, included, within the years of the cube
+    metrics: list
+        Metric columns exported
+    Example
+    --------
+    > for chunk in iter_chunks(cube, "region", "Asia", 1800, 2018, ["life_expectancy"]): ...
+    """
+    columns = ROW_COLUMNS + metrics
+    for start in range(first, last + 1, CHUNK_YEARS):
+        end = min(start + CHUNK_YEARS - 1, last)
+        chunk = cube.select(level, value, start, end)[columns]
+        yield chunk.dropna(how="all", subset=metrics)
+
+
+def iter_csv(chunks):
+    """Encode a stream of DataFrames as one CSV document."""
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode()
+        header = False
+
+
+def iter_arrow(chunks):
+    """
+    Encode a stream of DataFrames as an Arrow IPC stream, one record batch
+    per DataFrame. Requires pyarrow.
+    """
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = None
+    for chunk in chunks:
+        batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(sink)
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def byte_range(chunks, start, stop):
+    """The bytes from `start` up to `stop` (excluded) of a stream of chunks."""
+    position = 0
+    for chunk in chunks:
+        end = position + len(chunk)
+        if end > start:
+            yield chunk[max(start - position, 0) : stop - position]
+        position = end
+        if position >= stop:
+            return
@@ -0,0 +1,284 @@
+"""
+Country geometry for the world map, served by the app itself rather than
+fetched from a CDN, and clipped, projected and simplified per region for
+the zoomed maps.
+
+data/world-110m.json holds the Natural Earth 1:110m admin-0 countries
+(public domain) as TopoJSON, with one object named "countries" whose
+geometries carry their ISO 3166-1 numeric code as id, matching
+country_ids.csv and the vega-datasets world-110m file.
+"""
+import hashlib
+
+import numpy as np
+
+# polygons smaller than this share of a country's largest polygon (overseas
+# territories, small islands) don't count towards its region's extent
+MIN_PART_SHARE = 0.25
+
+# a country whose landmass grows a region's extent by more than this factor
+# is clipped to the rest of the region (e.g. Russia in Europe)
+MAX_EXTENT_GROWTH = 2
+
+
+class GeometryAssets:
+    """
+    In-memory TopoJSON/GeoJSON files, each published under a file name that
+    embeds a fingerprint of its content, so browsers may cache them
+    indefinitely.
+    Example
+    --------
+    > assets = GeometryAssets()
+    > filename = assets.add("world-110m", content)
+    > assets.get(filename)
+    """
+
+    def __init__(self):
+        self._files = {}
+
+    def add(self, name, content):
+        """Publish content under `name` and return its fingerprinted file name."""
+        filename = f"{name}.{hashlib.sha256(content).hexdigest()[:12]}.json"
+        self._files[filename] = content
+        return filename
+
+    def get(self, filename):
+        return self._files.get(filename)
+
+
+def read_topology(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def decode_topology(topology, name="countries"):
+    """
+    Decode the geometries of a quantized TopoJSON object.
+    Parameters
+    --------
+    topology: dict
+        Parsed TopoJSON
+    name: string
+        Name of the object holding the geometries
+    Returns
+    --------
+    countries
+        Dict mapping each geometry id to its polygons, each a list of rings
+        given as (n, 2) arrays of longitude/latitude
+    """
+    scale = np.array(topology["transform"]["scale"])
+    translate = np.array(topology["transform"]["translate"])
+    arcs = [np.cumsum(arc, axis=0) * scale + translate for arc in topology["arcs"]]
+
+    def ring(indices):
+        return np.concatenate([arcs[i] if i >= 0 else arcs[~i][::-1] for i in indices])
+
+    countries = {}
+    for geom in topology["objects"][name]["geometries"]:
+        polygons = geom["arcs"] if geom["type"] == "MultiPolygon" else [geom["arcs"]]
+        countries.setdefault(geom["id"], []).extend(
+            [ring(indices) for indices in polygon] for polygon in polygons
+        )
+    return countries
+
+
+def ring_area(ring):
+    """Planar area of a ring, positive for clockwise (exterior) rings."""
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * np.sum(x[1:] * y[:-1] - x[:-1] * y[1:])
+
+
+def get_bbox(points):
+    return (*points.min(axis=0), *points.max(axis=0))
+
+
+def union_bbox(bboxes):
+    bboxes = np.array(bboxes)
+    return (*bboxes[:, :2].min(axis=0), *bboxes[:, 2:].max(axis=0))
+
+
+def get_region_bbox(countries, ids):
+    """
+    Bounding box of the main landmasses of every country in a region.
+    Overseas territories don't count, and a country that would more than
+    double the region's extent (Russia in Europe) is clipped to the extent
+    of the others.
+    """
+    bboxes = []
+    for id in ids:
+        if id not in countries:
+            continue
+        exteriors = [polygon[0] for polygon in countries[id]]
+        largest = max(map(ring_area, exteriors))
+        bboxes.append(
+            union_bbox(
+                [
+                    get_bbox(ring)
+                    for ring in exteriors
+                    if ring_area(ring) >= MIN_PART_SHARE * largest
+                ]
+            )
+        )
+    kept = []
+    for i, bbox in enumerate(bboxes):
+        others = union_bbox(bboxes[:i] + bboxes[i + 1 :])
+        grown = union_bbox([others, bbox])
+        if all(
+            grown[k + 2] - grown[k] <= MAX_EXTENT_GROWTH * (others[k + 2] - others[k])
+            for k in (0, 1)
+        ):
+            kept.append(bbox)
+    return union_bbox(kept)
+
+
+def clip_ring(ring, bbox):
+    """Clip a ring to a bounding box (Sutherland-Hodgman)."""
+    x0, y0, x1, y1 = bbox
+    rx0, ry0, rx1, ry1 = get_bbox(ring)
+    if rx0 > x1 or rx1 < x0 or ry0 > y1 or ry1 < y0:
+        return None
+    if rx0 >= x0 and rx1 <= x1 and ry0 >= y0 and ry1 <= y1:
+        return ring
+    edges = [
+        (lambda p: p[0] >= x0, lambda p, q: _cross_x(p, q, x0)),
+        (lambda p: p[0] <= x1, lambda p, q: _cross_x(p, q, x1)),
+        (lambda p: p[1] >= y0, lambda p, q: _cross_y(p, q, y0)),
+        (lambda p: p[1] <= y1, lambda p, q: _cross_y(p, q, y1)),
+    ]
+    points = list(ring[:-1])
+    for inside, cross in edges:
+        if not points:
+            break
+        clipped = []
+        for prev, point in zip(points[-1:] + points[:-1], points):
+            if inside(point):
+                if not inside(prev):
+                    clipped.append(cross(prev, point))
+                clipped.append(point)
+            elif inside(prev):
+                clipped.append(cross(prev, point))
+        points = clipped
+    if len(points) < 3:
+        return None
+    return np.array(points + points[:1])
+
+
+def _cross_x(p, q, x):
+    return np.array([x, p[1] + (q[1] - p[1]) * (x - p[0]) / (q[0] - p[0])])
+
+
+def _cross_y(p, q, y):
+    return np.array([p[0] + (q[0] - p[0]) * (y - p[1]) / (q[1] - p[1]), y])
+
+
+def natural_earth(points):
+    """Natural Earth projection of longitude/latitude degrees (d3's naturalEarth1)."""
+    lam, phi = np.radians(points[:, 0]), np.radians(points[:, 1])
+    phi2 = phi * phi
+    phi4 = phi2 * phi2
+    x = lam * (0.8707 - 0.131979 * phi2 + phi4 * (-0.013791 + phi4 * (0.003971 * phi2 - 0.001529 * phi4)))
+    y = phi * (1.007226 + phi2 * (0.015085 + phi4 * (-0.044475 + 0.028874 * phi2 - 0.005916 * phi4)))
+    return np.column_stack([x, y])
+
+
+def simplify_ring(ring, tolerance):
+    """Douglas-Peucker simplification of a closed ring."""
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        dx, dy = ring[j] - ring[i]
+        rest = ring[i + 1 : j] - ring[i]
+        norm = np.hypot(dx, dy)
+        if norm:
+            dist = np.abs(dx * rest[:, 1] - dy * rest[:, 0]) / norm
+        else:
+            dist = np.hypot(rest[:, 0], rest[:, 1])
+        k = np.argmax(dist)
+        if dist[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack += [(i, k), (k, j)]
+    return ring[keep]
+
+
+def build_region_geometry(countries, ids, width, height, tolerance=0.5):
+    """
+    Clip the world to the bounding box of a region, project it with the
+    Natural Earth projection, fit it to the chart size and simplify it to
+    the given tolerance in pixels.
+    Parameters
+    --------
+    countries: dict
+        Decoded world geometry, from decode_topology
+    ids: list of int
+        Ids of the countries in the region, which determine the clip box
+    width, height: int
+        Size of the map in pixels
+    tolerance: float
+        Simplification tolerance, in pixels
+    Returns
+    --------
+    geojson
+        FeatureCollection in pixel coordinates, to be drawn with the
+        identity projection
+    Example
+    --------
+    > build_region_geometry(countries, [36, 554], 900, 350)
+    """
+    bbox = get_region_bbox(countries, ids)
+    clipped = {}
+    for id, polygons in countries.items():
+        parts = []
+        for polygon in polygons:
+            rings = [clip_ring(ring, bbox) for ring in polygon]
+            if rings[0] is not None:
+                parts.append([natural_earth(ring) for ring in rings if ring is not None])
+        if parts:
+            clipped[id] = parts
+
+    # fit the projected clip box to the chart, north up
+    x0, y0, x1, y1 = get_bbox(natural_earth(_bbox_outline(bbox)))
+    scale = min(width / (x1 - x0), height / (y1 - y0))
+    offset = np.array([(width - scale * (x1 - x0)) / 2, (height - scale * (y1 - y0)) / 2])
+
+    features = []
+    for id, parts in clipped.items():
+        polygons = []
+        for rings in parts:
+            rings = [
+                simplify_ring(
+                    (ring - [x0, y1]) * [scale, -scale] + offset, tolerance
+                ).round(1)
+                for ring in rings
+            ]
+            rings = [ring.tolist() for ring in rings if len(ring) >= 4]
+            if rings:
+                polygons.append(rings)
+        if polygons:
+            features.append(
+                {
+                    "type": "Feature",
+                    "id": id,
+                    "properties": {},
+                    "geometry": {"type": "MultiPolygon", "coordinates": polygons},
+                }
+            )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _bbox_outline(bbox, steps=32):
+    """Points along the edges of a bounding box, whose projection is curved."""
+    x0, y0, x1, y1 = bbox
+    xs, ys = np.linspace(x0, x1, steps), np.linspace(y0, y1, steps)
+    return np.concatenate(
+        [
+            np.column_stack([xs, np.full(steps, y0)]),
+            np.column_stack([xs, np.full(steps, y1)]),
+            np.column_stack([np.full(steps, x0), ys]),
+            np.column_stack([np.full(steps, x1), ys]),
+        ]
+    )
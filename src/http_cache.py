@@ -0,0 +1,106 @@
+"""
+HTTP compression and validation of the app's responses.
+
+Responses are compressed with brotli or gzip, whichever the client accepts.
+Dash callback responses get an ETag derived from the callback inputs and
+the version of the data and code drawing them, computed before the callback
+runs: a request repeating one whose response the client already holds (its
+If-None-Match matches) is answered 304 without running the callback. The
+compressed body of every response with a strong ETag is cached, so that hot
+responses are compressed once.
+"""
+import hashlib
+import json
+
+import flask
+from flask_compress import Compress
+
+CALLBACK_PATH = "_dash-update-component"
+
+# callback state that identifies the page view rather than what is drawn
+IGNORED_STATE = {"session"}
+
+
+def callback_etag(payload, version):
+    """
+    ETag of the response to a Dash callback request, from the callback and
+    its input and state values.
+    Parameters
+    --------
+    payload: dict
+        Body of the _dash-update-component request
+    version: string
+        Version of the data and code the response is computed with
+    """
+    state = [s for s in payload.get("state") or [] if s.get("id") not in IGNORED_STATE]
+    key = json.dumps([version, payload.get("output"), payload.get("inputs"), state], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class CompressedResponses:
+    """
+    Flask-Compress cache backend keeping compressed bodies in a ChartCache
+    of their own, keyed by the ETag of the response. Responses without one, whose key is
+    empty, are not cached.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, key):
+        if key.endswith(";"):
+            return None
+        return self.cache.get(("compressed", key))
+
+    def set(self, key, value):
+        if not key.endswith(";"):
+            self.cache.set(("compressed", key), value)
+
+
+def init_http_cache(server, cache, version):
+    """
+    Compress the responses of a Flask server and validate its Dash callback
+    responses with ETags.
+    Parameters
+    --------
+    server: Flask
+        The Dash app's server
+    cache: ChartCache
+        Cache holding the compressed responses, apart from the charts
+    version: string or callable
+        Version of the data and code the callbacks are computed with, or a
+        function returning the version for the running request
+    """
+    server.config.update(
+        COMPRESS_ALGORITHM=["br", "gzip"],
+        COMPRESS_CACHE_BACKEND=lambda: CompressedResponses(cache),
+        COMPRESS_CACHE_KEY=lambda request: flask.g.get("etag", ""),
+    )
+    Compress(server)
+
+    @server.before_request
+    def check_callback_etag():
+        request = flask.request
+        if request.method != "POST" or not request.path.endswith(CALLBACK_PATH):
+            return None
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return None
+        flask.g.etag = callback_etag(payload, version() if callable(version) else version)
+        # the client may hold the tag suffixed with the compression, e.g. "<tag>:br"
+        if any(tag.split(":")[0] == flask.g.etag for tag in request.if_none_match.as_set()):
+            response = flask.Response(status=304)
+            response.set_etag(flask.g.etag)
+            return response
+        return None
+
+    # registered after Compress, so that it runs before it
+    @server.after_request
+    def set_etag(response):
+        etag = flask.g.get("etag")
+        if etag and response.status_code == 200:
+            response.set_etag(etag)
+        else:
+            etag, weak = response.get_etag()
+            flask.g.etag = etag if etag and not weak else ""
+        return response
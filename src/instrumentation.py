@@ -0,0 +1,219 @@
+"""
+Latency and payload instrumentation of the Dash callbacks, exposed in the
+Prometheus text format.
+
+Every callback registered after `instrument(app)` records its duration and
+response size, and the time spent in each stage it goes through (filtering
+the data, building the chart, serializing it). Metrics are kept per process,
+so with several gunicorn workers each scrape reports the worker serving it.
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+# stage timings of the callback running in the current thread
+_stages = contextvars.ContextVar("stages", default=None)
+
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed buckets, keyed by label values.
+    Parameters
+    --------
+    name: string
+        Metric name
+    help: string
+        Metric description
+    labels: tuple of string
+        Label names
+    buckets: list of float
+        Upper bounds of the buckets
+    """
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self._series.get(label_values, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[label_values] = (counts, total + value)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, (counts, total) in series:
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Histograms plus gauges and counters read from callables at scrape time."""
+
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, name, help, labels, buckets):
+        histogram = Histogram(name, help, labels, buckets)
+        self.histograms.append(histogram)
+        return histogram
+
+    def collect(self, name, help, type, func):
+        """Report the value returned by `func` as a gauge or counter."""
+        self.collectors.append((name, help, type, func))
+
+    def expose(self):
+        lines = []
+        for histogram in self.histograms:
+            lines += histogram.expose()
+        for name, help, type, func in self.collectors:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {type}", f"{name} {func()}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+callback_duration = registry.histogram(
+    "mindthegap_callback_duration_seconds",
+    "Time spent in each Dash callback.",
+    ("callback",),
+    LATENCY_BUCKETS,
+)
+stage_duration = registry.histogram(
+    "mindthegap_callback_stage_duration_seconds",
+    "Time spent in each stage (filter, build, serialize) of a Dash callback.",
+    ("callback", "stage"),
+    LATENCY_BUCKETS,
+)
+response_size = registry.histogram(
+    "mindthegap_callback_response_bytes",
+    "Size of the value returned by each Dash callback.",
+    ("callback",),
+    SIZE_BUCKETS,
+)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the callback running in the current thread."""
+    stages = _stages.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stages is not None:
+            stages[name] = stages.get(name, 0) + time.perf_counter() - start
+
+
+@contextmanager
+def recorded_stages():
+    """
+    Record the stage timings of the block in a dict of their own, e.g. in a
+    render process, to be added to the callback they belong to with
+    `add_stages`.
+    """
+    stages = {}
+    token = _stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _stages.reset(token)
+
+
+def add_stages(stages):
+    """Add stage timings recorded elsewhere to the callback running in the current thread."""
+    current = _stages.get()
+    if current is not None:
+        for name, seconds in stages.items():
+            current[name] = current.get(name, 0) + seconds
+
+
+def timed_stage(name):
+    """Decorate a function so that each call is timed as a callback stage."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed(func, slow_threshold=None):
+    """
+    Decorate a callback to record its duration, response size and stages.
+    Time not spent in a timed stage of a callback that went through any
+    stage is recorded as the "build" stage. Durations are recorded for calls
+    that raise too, e.g. PreventUpdate. Calls slower than `slow_threshold`
+    seconds are logged along with their inputs.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        name = func.__name__
+        stages = {}
+        token = _stages.set(stages)
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _stages.reset(token)
+            callback_duration.observe(elapsed, name)
+            if stages:
+                stages["build"] = max(elapsed - sum(stages.values()), 0)
+                for stage_name, seconds in stages.items():
+                    stage_duration.observe(seconds, name, stage_name)
+            if slow_threshold is not None and elapsed > slow_threshold:
+                logger.warning("Slow callback %s%r took %.3fs", name, args, elapsed)
+        outputs = result if isinstance(result, (list, tuple)) else [result]
+        sizes = [len(output) for output in outputs if isinstance(output, (str, bytes))]
+        if sizes:
+            response_size.observe(sum(sizes), name)
+        return result
+
+    return wrapper
+
+
+def instrument(app, slow_threshold=None):
+    """
+    Time every callback registered on `app` from now on.
+    Parameters
+    --------
+    app: Dash
+        The Dash app
+    slow_threshold: float, optional
+        Log callbacks slower than this many seconds, with their inputs
+    """
+    register = app.callback
+
+    @functools.wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda func: decorator(timed(func, slow_threshold))
+
+    app.callback = callback
@@ -0,0 +1,207 @@
+"""
+Rendering of charts in a bounded pool of processes, off the request threads.
+
+Building and serializing an Altair chart is CPU-bound Python, so request
+threads rendering charts in the same process hold each other up on the GIL,
+and a single-threaded worker rendering a slow chart holds up every request
+queued behind it. With a render pool, a worker's request threads only wait
+for charts rendered by processes of their own, and keep serving cached
+charts, the layout and the other callbacks in the meantime.
+
+The pool processes are forked from the worker and call the plotting
+functions registered with `offload` directly. At most `max_pending` charts
+are being rendered or queued at once: a render waits up to `queue_timeout`
+seconds for a place, then fails with RenderPoolBusy, and a render taking
+longer than `timeout` seconds fails with RenderTimeout. A render that timed
+out still runs to the end, and still takes up its place meanwhile. When a
+pool process dies (e.g. killed for using too much memory), the pool is
+replaced by a new one and the renders it failed are tried once more.
+
+The stages of a render timed in a pool process (e.g. serializing the chart)
+are sent back with the chart and count towards the calling callback.
+
+The pool processes hold the data as it was when they were forked: with a
+`context`, whatever a render depends on besides its arguments (e.g. the
+version of the data a request is pinned to) is captured by the calling
+thread and restored in the pool process before the chart is rendered, or
+the chart is rendered by the calling thread if it can't be restored.
+"""
+import functools
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from instrumentation import add_stages, recorded_stages
+
+# plotting functions by module and name, with the pool rendering them, as
+# inherited by the forked pool processes
+_functions = {}
+
+
+class RenderPoolBusy(Exception):
+    """Too many charts are already being rendered."""
+
+
+class RenderTimeout(Exception):
+    """A chart took too long to render."""
+
+
+class RenderPool:
+    """
+    Pool of processes rendering the charts of a worker.
+    Parameters
+    --------
+    processes: int
+        Number of rendering processes, 0 to render in the calling thread
+    max_pending: int, optional
+        Maximum number of charts rendered or queued at once, twice the
+        number of processes by default
+    queue_timeout: float
+        Seconds to wait for a place in the queue, before RenderPoolBusy
+    timeout: float
+        Seconds to wait for a chart, before RenderTimeout
+    context: object, optional
+        Object whose `capture()` is called in the calling thread, and whose
+        `restore()` is called with its result in the pool process, before
+        each render; when `restore()` returns False, the chart is rendered
+        in the calling thread instead
+    Example
+    --------
+    > pool = RenderPool(processes=2)
+    > @pool.offload
+    > def plot(metric, yr): ...
+    > pool.start()
+    """
+
+    def __init__(self, processes=0, max_pending=None, queue_timeout=1.0, timeout=30.0, context=None):
+        self.processes = processes
+        self.max_pending = max_pending or 2 * processes
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.context = context
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.unrestored = 0
+        self._slots = threading.BoundedSemaphore(max(self.max_pending, 1))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Fork the rendering processes, unless already started in this
+        process. Call it before the process starts any threads, as forking
+        a process in the middle of another thread's work can leave its
+        locks held for good in the child.
+        """
+        with self._lock:
+            if not self.processes or self._pid == os.getpid():
+                return
+            self._executor = ProcessPoolExecutor(
+                self.processes,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_process,
+            )
+            # forked all at once on the first submission
+            self._executor.submit(int).result()
+            self._pid = os.getpid()
+
+    def offload(self, func):
+        """Decorate a plotting function so that it is rendered in the pool."""
+        name = f"{func.__module__}.{func.__qualname__}"
+        _functions[name] = (func, self)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.processes:
+                return func(*args, **kwargs)
+            return self.render(name, *args, **kwargs)
+
+        return wrapper
+
+    def render(self, name, *args, **kwargs):
+        """
+        Render the chart of a registered function in the pool, once more in
+        a new pool if a pool process died.
+        """
+        try:
+            return self._render_once(name, args, kwargs)
+        except BrokenProcessPool:
+            return self._render_once(name, args, kwargs)
+
+    def _render_once(self, name, args, kwargs):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise RenderPoolBusy(f"{self.max_pending} charts already pending")
+        with self._lock:
+            self.pending += 1
+        executor = None
+        try:
+            self.start()
+            state = self.context.capture() if self.context is not None else None
+            executor = self._executor
+            future = executor.submit(_render, name, args, kwargs, state)
+        except BaseException as error:
+            self._release()
+            if isinstance(error, BrokenProcessPool):
+                self._restart(executor)
+            raise
+        future.add_done_callback(lambda _: self._release())
+        try:
+            result, stages = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            raise RenderTimeout(f"{name}{args!r} took over {self.timeout}s") from None
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        if stages is None:
+            # the pool process couldn't restore the context of the render
+            self.unrestored += 1
+            return _functions[name][0](*args, **kwargs)
+        add_stages(stages)
+        return result
+
+    def _restart(self, executor):
+        """
+        Replace a broken pool by a new one, unless another thread already
+        did. Unlike those of `start`, the new processes are forked from a
+        worker that is already running request threads.
+        """
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+            self._pid = None
+            self.restarts += 1
+        executor.shutdown(wait=False)
+        self.start()
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+
+def _init_process():
+    # the worker's signal handlers (e.g. gunicorn's graceful shutdown on
+    # SIGTERM) don't apply to the pool processes, which the worker shuts down
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGQUIT, signal.SIG_DFL)
+
+
+def _render(name, args, kwargs, state):
+    func, pool = _functions[name]
+    if pool.context is not None and not pool.context.restore(state):
+        return None, None
+    # the stages timed in the pool process count towards the calling callback
+    with recorded_stages() as stages:
+        result = func(*args, **kwargs)
+    return result, stages
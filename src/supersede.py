@@ -0,0 +1,71 @@
+"""
+Superseding of in-flight callback computations by newer requests from the
+same browser session, so that workers don't render charts nobody will see.
+
+The latest request of every session is recorded in a small table in shared
+memory. When the table is created before gunicorn forks its workers (with
+preload_app), a request served by one worker supersedes a request from the
+same session still running in another; otherwise only requests served by
+the same worker do. Sessions are hashed into a fixed number of slots: a
+session taking over the slot of another only keeps the other's requests
+from being superseded, it never supersedes a current request.
+"""
+import hashlib
+import mmap
+import multiprocessing
+
+import numpy as np
+
+
+class RequestTracker:
+    """
+    Latest request of each session, shared by forked processes.
+    Parameters
+    --------
+    slots: int
+        Number of sessions tracked at once
+    Example
+    --------
+    > tracker = RequestTracker()
+    > token = tracker.start(session)
+    > ...
+    > if tracker.is_superseded(session, token):
+    >     raise PreventUpdate
+    """
+
+    def __init__(self, slots=65536):
+        self.slots = slots
+        self.superseded = 0
+        # last token handed out, then one (session hash, token) row per slot
+        self._buffer = mmap.mmap(-1, 8 * (2 * slots + 2))
+        table = np.frombuffer(self._buffer, dtype=np.uint64).reshape(-1, 2)
+        self._last_token = table[0]
+        self._table = table[1:]
+        self._lock = multiprocessing.Lock()
+
+    def start(self, session):
+        """Record a new request from `session` and return its token."""
+        if not session:
+            return None
+        digest = _hash(session)
+        with self._lock:
+            self._last_token[0] += 1
+            token = int(self._last_token[0])
+            self._table[digest % self.slots] = (digest, token)
+        return token
+
+    def is_superseded(self, session, token):
+        """Whether a newer request from `session` started after `token`."""
+        if token is None:
+            return False
+        digest = _hash(session)
+        with self._lock:
+            owner, latest = map(int, self._table[digest % self.slots])
+        if owner == digest and latest != token:
+            self.superseded += 1
+            return True
+        return False
+
+
+def _hash(session):
+    return int.from_bytes(hashlib.blake2b(session.encode(), digest_size=8).digest(), "little")
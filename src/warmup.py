@@ -0,0 +1,99 @@
+"""
+Pre-render every chart reachable from the control panel without a country
+selected into the on-disk chart store, so that gunicorn workers serve them
+with a single file read instead of rendering them cold. Charts of a single
+country, and the country drill-down, are rendered on demand.
+
+Usage:
+    python src/warmup.py [--out DIR] [--jobs N]
+"""
+import argparse
+import inspect
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import app
+from chart_cache import ChartStore
+
+RADIO = ["Top", "Bottom"]
+
+
+def get_years():
+    """Years selectable on the year slider."""
+    first, last = app.ANIMATION_YEARS
+    return list(range(first, last + 1))
+
+
+def get_geographies():
+    """
+    All (region, sub_region) pairs reachable from the dropdowns: no
+    selection, any sub region without a region, and every region with
+    each of its own sub regions.
+    """
+    regions = app.geography["regions"]
+    geographies = [(None, None)]
+    geographies += [(None, sr) for sub_regions in regions.values() for sr in sub_regions]
+    for region, sub_regions in regions.items():
+        geographies.append((region, None))
+        geographies += [(region, sr) for sr in sub_regions]
+    return geographies
+
+
+def get_jobs():
+    """
+    Enumerate every (plotting function, arguments) pair the dashboard can
+    request, following each callback's own argument order.
+    """
+    years = get_years()
+    regions = [None, *app.geography["regions"]]
+    geographies = get_geographies()
+    jobs = []
+    for metric in app.metrics:
+        for region, yr in itertools.product(regions, years):
+            jobs.append(("plot_world_map", (metric, region, yr)))
+        for (region, sub_region), yr in itertools.product(geographies, years):
+            jobs.append(("plot_box_plot", (metric, region, sub_region, None, yr)))
+            jobs.append(("plot_bubble_chart", (metric, region, sub_region, None, yr)))
+            for radio in RADIO:
+                jobs.append(("plot_bar_chart", (metric, region, radio, sub_region, yr)))
+    return jobs
+
+
+def render(job):
+    name, args = job
+    # bypass the Dash callback and chart cache wrappers
+    func = inspect.unwrap(getattr(app, name))
+    return (name, *args), func(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--out",
+        default=app.chart_cache.store.root,
+        help="chart store directory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="number of rendering processes (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    jobs = get_jobs()
+    start = time.perf_counter()
+    store = ChartStore(args.out, app.chart_version(app.data_version))
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        store.write(pool.map(render, jobs, chunksize=16))
+    objects = len(os.listdir(os.path.join(args.out, "objects")))
+    print(
+        f"Rendered {len(jobs)} charts ({objects} unique) into {args.out} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
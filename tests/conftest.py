@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the app runs from src/, as gunicorn does (chdir=src)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def update_charts(client, headers=None, **values):
+    """Send the update_charts callback request of the given control values."""
+    deps = client.get("/_dash-dependencies").get_json()
+    dep = next(d for d in deps if "drawn.data" in d["output"])
+    outputs = [
+        dict(zip(("id", "property"), output.rsplit(".", 1)))
+        for output in dep["output"].strip(".").split("...")
+    ]
+    body = {
+        "output": dep["output"],
+        "outputs": outputs,
+        "inputs": [{**inp, "value": values.get(inp["id"])} for inp in dep["inputs"]],
+        "state": [{**st, "value": {} if st["id"] == "drawn" else "test"} for st in dep["state"]],
+        "changedPropIds": ["country.value"],
+    }
+    return client.post("/_dash-update-component", json=body, headers=headers)
+
+
+@pytest.fixture
+def client():
+    app.chart_cache.clear()
+    app.compressed_cache.clear()
+    return app.server.test_client()
+
+
+def test_boxplot_stats_without_rows():
+    data = app.filter_data(None, None, "Bosnia and Herzegovina", 1980)
+    stats, outliers = app.boxplot_stats(data, "co2_emissions")
+    assert stats.empty and outliers.empty
+    assert list(stats.columns) == ["income_group", "q1", "median", "q3", "lower", "upper"]
+
+
+def test_income_tab_of_a_country_without_data(client):
+    response = update_charts(
+        client,
+        metric="co2_emissions",
+        radio="Top",
+        country="Bosnia and Herzegovina",
+        yr=1980,
+        tabs="income",
+        animate=False,
+    )
+    assert response.status_code == 200
+    assert "boxplot" in json.dumps(response.get_json()["response"])
+
+
+def test_value_domain_without_values():
+    assert app.value_domain(pd.Series([1.0, np.nan, 3.0])) == [1.0, 3.0]
+    assert app.value_domain(pd.Series([np.nan, np.nan])) is app.alt.Undefined
+
+
+def test_animated_bubble_chart_without_values(client):
+    response = update_charts(
+        client,
+        metric="co2_emissions",
+        radio="Top",
+        country="South Sudan",
+        yr=2010,
+        tabs="gdp",
+        animate=True,
+    )
+    assert response.status_code == 200
+    assert "NaN" not in response.get_data(as_text=True)
+
+
+def test_compressed_responses_are_cached_apart_from_the_charts(client):
+    values = dict(metric="life_expectancy", radio="Top", yr=2010, tabs="gdp")
+    response = update_charts(client, headers={"Accept-Encoding": "gzip"}, **values)
+    assert response.headers["Content-Encoding"] == "gzip"
+    charts = app.chart_cache.stats()
+    assert app.compressed_cache.stats()["entries"] == 1
+    update_charts(client, headers={"Accept-Encoding": "gzip"}, **values)
+    assert app.compressed_cache.stats()["hits"] == 1
+    assert app.chart_cache.stats()["entries"] == charts["entries"]
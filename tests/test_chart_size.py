@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+import app
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from check_chart_size import BUDGETS, chart_size, trend_countries  # noqa: E402
+
+# the largest charts of the full sweep (world, total CO2 emissions, 2010),
+# and smaller geographies and years
+SELECTIONS = [
+    ("plot_world_map", ("co2_emissions", None, 2010)),
+    ("plot_world_map", ("life_expectancy", "Asia", 1970)),
+    ("plot_box_plot", ("co2_emissions", None, None, None, 2010)),
+    ("plot_box_plot", ("child_mortality", "Europe", "Northern Europe", None, 1970)),
+    ("plot_bubble_chart", ("co2_emissions", None, None, None, 2010)),
+    ("plot_bubble_chart", ("life_expectancy", "Asia", None, "India", 1970)),
+    ("plot_bar_chart", ("life_expectancy_gain", "Americas", "Bottom", None, 1970)),
+    ("plot_bar_chart", ("co2_emissions", None, "Top", None, 2010)),
+    ("plot_world_map_years", ("co2_emissions", None, 2010)),
+    ("plot_bubble_chart_years", ("co2_emissions", None, None, None, 2010)),
+    ("plot_country_trends", ("co2_emissions", None)),
+]
+
+
+@pytest.mark.parametrize("name, args", SELECTIONS)
+def test_chart_within_its_budget(monkeypatch, name, args):
+    monkeypatch.setattr(app, "chart_renderer", "vega")
+    if name == "plot_country_trends":
+        args = (args[0], trend_countries(args[0]))
+    assert chart_size(name, args) <= BUDGETS[name]
+
+
+def test_every_chart_has_a_selection():
+    assert {name for name, _ in SELECTIONS} == set(BUDGETS)
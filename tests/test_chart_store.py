@@ -0,0 +1,24 @@
+import app
+from chart_cache import ChartCache, ChartStore
+
+
+def plot_world_map(metric, region, yr):
+    return "rendered"
+
+
+def memoized(root, version):
+    ChartStore(root, version).write([(("plot_world_map", "life_expectancy", None, 2010), "stored")])
+    current = app.chart_version(app.data_version)
+    cache = ChartCache(store=ChartStore(root, current), version=lambda: current)
+    return cache.memoize(plot_world_map)
+
+
+def test_store_of_the_current_charts_is_served(tmp_path):
+    plot = memoized(str(tmp_path), app.chart_version(app.data_version))
+    assert plot("life_expectancy", None, 2010) == "stored"
+
+
+def test_store_rendered_by_other_code_is_ignored(tmp_path):
+    # same data, charts drawn before a change to the plotting code
+    plot = memoized(str(tmp_path), f"{app.data_version}-0000000000000000-{app.chart_renderer}")
+    assert plot("life_expectancy", None, 2010) == "rendered"
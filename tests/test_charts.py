@@ -0,0 +1,107 @@
+import inspect
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+GEOGRAPHIES = [(None, None), ("Asia", None), ("Europe", "Northern Europe")]
+
+
+@pytest.fixture
+def spec(monkeypatch):
+    """Render a chart as its Vega-Lite spec."""
+    monkeypatch.setattr(app, "chart_renderer", "vega")
+    return lambda name, *args: json.loads(inspect.unwrap(getattr(app, name))(*args))
+
+
+def inlined(spec, view):
+    """The rows a view of a chart inlines, as they are parsed in the browser."""
+    return pd.read_csv(io.StringIO(spec["datasets"][view["data"]["name"]]))
+
+
+def encodings(view):
+    return {
+        channel: (enc["field"], enc.get("type"))
+        for channel, enc in view["encoding"].items()
+        if not isinstance(enc, list)
+    }
+
+
+@pytest.mark.parametrize("metric, yr", [("child_mortality", 2000), ("life_expectancy", 1970)])
+def test_boxplot_stats_match_percentiles(metric, yr):
+    data = app.filter_data(None, None, None, yr)
+    stats, outliers = app.boxplot_stats(data, metric)
+    assert not stats.empty
+    for _, row in stats.iterrows():
+        values = data.loc[data["income_group"] == row["income_group"], metric].dropna()
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        assert np.allclose([row["q1"], row["median"], row["q3"]], [q1, median, q3])
+        inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+        assert (row["lower"], row["upper"]) == (inside.min(), inside.max())
+        outlying = outliers.loc[outliers["income_group"] == row["income_group"], metric]
+        assert len(outlying) + len(inside) == len(values)
+
+
+@pytest.mark.parametrize("region, sub_region", GEOGRAPHIES)
+@pytest.mark.parametrize("yr", [1970, 2000])
+def test_rank_countries_match_sort(region, sub_region, yr):
+    for metric in app.metrics:
+        data = app.filter_data(region, sub_region, None, yr).dropna(subset=[metric])
+        for radio, ascending in [("Top", False), ("Bottom", True)]:
+            ranked = app.rank_countries(metric, region, sub_region, yr, radio)
+            expected = (
+                data.assign(country=data["country"].astype(str))
+                .sort_values([metric, "country"], ascending=[ascending, True])
+                .head(app.RANK_COUNT)
+            )
+            assert len(ranked) == min(app.RANK_COUNT, len(data))
+            assert list(ranked["country"]) == list(expected["country"])
+
+
+def test_box_plot_spec(spec):
+    chart = spec("plot_box_plot", "child_mortality", None, None, None, 2000)
+    summary, points = chart["layer"]
+    whiskers, box, median = summary["layer"]
+
+    assert whiskers["mark"] == "rule"
+    assert encodings(whiskers) == {
+        "x": ("income_group", "nominal"),
+        "y": ("lower", "quantitative"),
+        "y2": ("upper", None),
+    }
+    assert box["mark"]["type"] == "bar"
+    assert encodings(box)["y"] == ("q1", "quantitative")
+    assert encodings(box)["y2"] == ("q3", None)
+    assert encodings(box)["color"] == ("income_group", "nominal")
+    assert median["mark"]["type"] == "tick"
+    assert encodings(median)["y"] == ("median", "quantitative")
+    assert points["mark"] == "point"
+    assert encodings(points)["y"] == ("child_mortality", "quantitative")
+
+    # one row per income group, with the statistics computed on the server
+    stats, outliers = app.boxplot_stats(app.filter_data(None, None, None, 2000), "child_mortality")
+    rows = inlined(chart, summary)
+    assert list(rows["income_group"]) == list(stats["income_group"].astype(str))
+    columns = ["q1", "median", "q3", "lower", "upper"]
+    assert np.allclose(rows[columns], stats[columns].astype(float), rtol=1e-3)
+    assert len(inlined(chart, points)) == len(outliers)
+
+
+@pytest.mark.parametrize("radio", ["Top", "Bottom"])
+def test_bar_chart_spec(spec, radio):
+    chart = spec("plot_bar_chart", "child_mortality", "Asia", radio, None, 2000)
+
+    assert chart["mark"] == "bar"
+    assert encodings(chart)["x"] == ("child_mortality", "quantitative")
+    # the bars keep the order of the rows
+    assert encodings(chart)["y"] == ("country", "nominal")
+    assert chart["encoding"]["y"]["sort"] is None
+
+    ranked = app.rank_countries("child_mortality", "Asia", None, 2000, radio)
+    rows = inlined(chart, chart)
+    assert list(rows["country"]) == list(ranked["country"].astype(str))
+    assert np.allclose(rows["child_mortality"], ranked["child_mortality"], rtol=1e-3)
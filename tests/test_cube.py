@@ -0,0 +1,17 @@
+import numpy as np
+
+import app
+
+
+def test_view_of_a_year_outside_the_year_axis():
+    cube = app.datasets.current.cube
+    for yr in (cube.years[0] - 1, cube.years[-1] + 1):
+        assert cube.view("life_expectancy", "region", "Asia", yr).shape == (0,)
+        assert cube.select("region", "Asia", yr, yr).empty
+
+
+def test_view_of_a_year():
+    cube = app.datasets.current.cube
+    values = cube.view("life_expectancy", "region", "Asia", 2010)
+    rows = cube.select("region", "Asia", 2010, 2010)
+    assert np.array_equal(values, rows["life_expectancy"].to_numpy(), equal_nan=True)
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from chart_cache import ChartCache
+from data_manager import DataManager
+
+
+class Files:
+    """Versions of the files on disk, loaded as they are at the time."""
+
+    def __init__(self, version):
+        self.version = version
+
+    def load(self):
+        return SimpleNamespace(version=self.version)
+
+
+def test_restore_a_version_no_longer_on_disk():
+    files = Files("a")
+    datasets = DataManager(files.load, lambda: files.version)
+    files.version = "c"
+    # a render of "b", captured before the files changed again
+    assert not datasets.restore("b")
+    assert datasets.restore("c") and datasets.current.version == "c"
+
+
+def test_charts_of_a_replaced_version_are_not_cached():
+    files = Files("a")
+    datasets = DataManager(files.load, lambda: files.version)
+    cache = ChartCache(
+        version=lambda: datasets.active().version, current=lambda: datasets.current.version
+    )
+    token = datasets.pin()
+    files.version = "b"
+    datasets.reload()
+    # a request still answered from "a" after the swap invalidated it
+    cache.set(("chart",), "of a")
+    assert cache.get(("chart",)) is None and cache.stats()["entries"] == 0
+    datasets.unpin(token)
+    cache.set(("chart",), "of b")
+    assert cache.get(("chart",)) == "of b"
@@ -0,0 +1,15 @@
+import app
+
+
+def test_byte_ranges_leave_the_chart_cache_alone():
+    client = app.server.test_client()
+    full = client.get("/export?region=Asia&first=2000&last=2010").data
+    before = app.chart_cache.stats()
+    for _ in range(2):
+        response = client.get(
+            "/export?region=Asia&first=2000&last=2010", headers={"Range": "bytes=10-99"}
+        )
+        assert response.status_code == 206
+        assert response.data == full[10:100]
+    after = app.chart_cache.stats()
+    assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
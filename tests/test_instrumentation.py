@@ -0,0 +1,47 @@
+import pytest
+from dash.exceptions import PreventUpdate
+
+from instrumentation import callback_duration, stage_duration, timed, timed_stage
+from render_pool import RenderPool
+
+pool = RenderPool(processes=1, timeout=10)
+
+
+@timed_stage("serialize")
+def serialize(value):
+    return str(value)
+
+
+@pool.offload
+def render(value):
+    return serialize(value)
+
+
+def count(histogram, *labels):
+    counts, _ = histogram._series.get(labels, ([0], 0))
+    return sum(counts)
+
+
+def test_prevented_callbacks_are_timed():
+    def prevented():
+        serialize(1)
+        raise PreventUpdate
+
+    callback = timed(prevented)
+    with pytest.raises(PreventUpdate):
+        callback()
+    assert count(callback_duration, "prevented") == 1
+    assert count(stage_duration, "prevented", "serialize") == 1
+
+
+def test_stages_of_pool_renders_are_timed():
+    pool.start()
+    try:
+        def pooled():
+            return render(1)
+
+        assert timed(pooled)() == "1"
+    finally:
+        pool._executor.shutdown()
+    assert count(stage_duration, "pooled", "serialize") == 1
+    assert count(stage_duration, "pooled", "build") == 1
@@ -0,0 +1,91 @@
+import os
+import signal
+import time
+
+import pytest
+
+from render_pool import RenderPool
+
+pool = RenderPool(processes=1, timeout=10)
+
+
+@pool.offload
+def process_id(value):
+    return value, os.getpid()
+
+
+@pytest.fixture
+def started():
+    pool.start()
+    yield pool
+    pool._executor.shutdown()
+    pool._pid = None
+
+
+def test_render_after_a_pool_process_died(started):
+    _, child = process_id(1)
+    assert child != os.getpid()
+    os.kill(child, signal.SIGKILL)
+    # until the executor notices, the next render may still be submitted to it
+    time.sleep(0.5)
+    value, new_child = process_id(2)
+    assert value == 2 and new_child not in (child, os.getpid())
+    assert pool.restarts == 1 and pool.pending == 0
+    assert process_id(3)[0] == 3
+
+
+def test_render_submitted_to_a_dying_pool(started):
+    restarts = pool.restarts
+    _, child = process_id(1)
+    os.kill(child, signal.SIGKILL)
+    # no wait: the render may reach the process before it is reaped
+    assert process_id(2)[0] == 2
+    assert pool.restarts == restarts + 1 and pool.pending == 0
+
+
+class Unloadable:
+    """Context of renders whose version the pool processes can't load."""
+
+    def capture(self):
+        return "replaced"
+
+    def restore(self, version):
+        return False
+
+
+unloadable_pool = RenderPool(processes=1, timeout=10, context=Unloadable())
+
+
+@unloadable_pool.offload
+def unloadable_process_id(value):
+    return value, os.getpid()
+
+
+def test_render_of_a_version_the_pool_cannot_load():
+    unloadable_pool.start()
+    try:
+        assert unloadable_process_id(1) == (1, os.getpid())
+        assert unloadable_pool.unrestored == 1 and unloadable_pool.pending == 0
+    finally:
+        unloadable_pool._executor.shutdown()
+        unloadable_pool._pid = None
+
+
+def named_alike(module, value):
+    def plot():
+        return value
+
+    plot.__module__ = module
+    return plot
+
+
+def test_functions_of_the_same_name_in_two_modules():
+    alike_pool = RenderPool(processes=1, timeout=10)
+    first = alike_pool.offload(named_alike("charts", 1))
+    second = alike_pool.offload(named_alike("other_charts", 2))
+    alike_pool.start()
+    try:
+        assert (first(), second()) == (1, 2)
+    finally:
+        alike_pool._executor.shutdown()
+        alike_pool._pid = None